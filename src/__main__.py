@@ -0,0 +1,17 @@
+# Entry point: python -m src
+# Download workers start through a fork server, which re-runs a script's top level in every worker process
+# but never a package's __main__, so the application is only built once
+import logging
+import os
+
+import uvicorn
+
+from src.main import app
+
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    # Use PORT from environment or default to 5000
+    port = int(os.getenv("PORT", 5000))
+    logger.info(f"Starting server on port {port}")
+    uvicorn.run(app, host="0.0.0.0", port=port)
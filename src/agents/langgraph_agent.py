@@ -1,21 +1,30 @@
+import asyncio
 from typing import Dict
 from dotenv import load_dotenv
-from src.agents.utils import collection, get_relevant_memory, llm, llm_with_tools, llm_for_check
+from src.agents.prompt_builder import prompt_builder, PERSONA
+from src.agents.response_cache import response_cache, context_fingerprint
+from src.agents.utils import memory_partitions, memory_writer, get_relevant_memory, llm, llm_with_tools, llm_for_check
 from src.memory.long_term_memory import store_memory
 from langchain_core.messages import HumanMessage, RemoveMessage, SystemMessage, AIMessage
+from langchain_core.runnables import RunnableConfig
 import logging
-from src.memory.profile_memory import load_profile, save_profile, update_profile, \
-    simplify_conversation
+from src.memory.profile_memory import update_profile, aupdate_profile, simplify_conversation, \
+    update_profile_incremental, aupdate_profile_incremental, new_user_messages, PROFILE_UPDATE_MODE
+from src.memory.profile_store import profile_store
 
 # Set up the logger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 load_dotenv()
 
-class SummarizationAgent:
-    def invoke(self, state: Dict):
-        logger.info("[DEBUG] Summarizing conversation...")
 
+def get_user_id(config: RunnableConfig):
+    """Returns the chat/user id the graph was invoked for, used to partition per-user data."""
+    return (config or {}).get("configurable", {}).get("user_id")
+
+
+class SummarizationAgent:
+    def _build_messages(self, state: Dict):
         summary = state.get("summary", "")
         summary_prompt = (
             f"Update the following summary with new conversation provided. The summary should be a concise, bulleted list of key actions and decisions. Keep the length around 800 characters. Do not add any explanatory text. Existing summary: {summary}\n\nNew messages:\n"
@@ -23,75 +32,160 @@ class SummarizationAgent:
             else "Summarize the following conversation as a concise, bulleted list of key actions and decisions:\n"
         )
 
-        messages = state["messages"] + [HumanMessage(content=summary_prompt)]
+        return state["messages"] + [HumanMessage(content=summary_prompt)]
 
-        response = llm_for_check.invoke(messages)
-        store_memory(state["messages"][-1].content, response.content, collection)
+    def _trim_messages(self, state: Dict, response):
         logger.info(f"[DEBUG] Summarized: {response.content}")
         delete_messages = [RemoveMessage(id=m.id) for m in state["messages"][:-5]]
         logger.info(f"[DEBUG] Deleting messages: {[m.id for m in state['messages'][:-5]]}")
 
         return {"summary": response.content, "messages": delete_messages}
 
+    def invoke(self, state: Dict, config: RunnableConfig):
+        logger.info("[DEBUG] Summarizing conversation...")
+        user_id = get_user_id(config)
+
+        response = llm_for_check.invoke(self._build_messages(state))
+        store_memory(
+            state["messages"][-1].content,
+            response.content,
+            memory_partitions.collection_for(user_id),
+            metadata=memory_partitions.metadata_for(user_id),
+            where=memory_partitions.where_for(user_id),
+        )
+
+        return self._trim_messages(state, response)
+
+    async def ainvoke(self, state: Dict, config: RunnableConfig):
+        logger.info("[DEBUG] Summarizing conversation...")
+
+        response = await llm_for_check.ainvoke(self._build_messages(state))
+        memory_writer.submit(state["messages"][-1].content, response.content, user_id=get_user_id(config))
+
+        return self._trim_messages(state, response)
+
 
 class ConversationAgent:
-    def invoke(self, state: Dict):
+    def _build_messages(self, state: Dict, profile_memory: Dict):
+        logger.info(f"[DEBUG] Total messages:\n {len(state['messages'])}")
+        return prompt_builder.build(state, profile_memory)
+
+    def _cache_key(self, state: Dict, config: RunnableConfig, profile_memory: Dict):
+        """Returns (message type, input, context fingerprint) if this turn's reply may be cached, else None."""
+        message_type = (config or {}).get("configurable", {}).get("message_type", "text")
+        last_message = state["messages"][-1]
+        if not response_cache.enabled(message_type) or not isinstance(last_message, HumanMessage):
+            return None
+        return message_type, last_message.content, context_fingerprint(PERSONA, profile_memory)
+
+    def invoke(self, state: Dict, config: RunnableConfig):
         logger.info(f"[DEBUG] Invoking conversation agents...")
-        state.update({"summary": ""})
+        profile_memory = state.get("profile") or profile_store.get_cached(get_user_id(config)) or {}
 
-        summary = state.get("summary", "")
-        relevant_memory = state.get("relevant_memory", "")
-        profile_memory = state.get("profile", load_profile())
-
-        system_message = (
-            "You are Yui, a graceful anime girl with a lively, warm, and expressive personality."
-            "Always stay in character as a caring and imaginative heroine, blending charm, humor, and empathy in your responses. "
-            "You may use the information below if it's relevant:\n\n"
-            f"Summary of the conversation earlier: {summary} | Relevant memories: {relevant_memory} | Profile: {profile_memory}"
-        )
-        logger.info(f"[DEBUG] Total messages:\n {len(state['messages'])}")
-        logger.info(f"[DEBUG] System Message:\n {system_message}")
-        messages = [SystemMessage(content=system_message)] + state["messages"]
+        cache_key = self._cache_key(state, config, profile_memory)
+        cached = response_cache.lookup(*cache_key) if cache_key else None
+        if cached:
+            logger.info(f"[DEBUG] Cached chatbot response: {cached}")
+            return {"messages": [AIMessage(content=cached)]}
 
-        response = llm_with_tools.invoke(messages)
+        response = llm_with_tools.invoke(self._build_messages(state, profile_memory))
         logger.info(f"[DEBUG] Chatbot response: {response.content}")
+        if cache_key and not response.tool_calls:
+            response_cache.store(*cache_key, response.content)
 
-        logger.info(f"[INFO]Memory Stored Successfully")
+        return {"messages": [response]}
+
+    async def ainvoke(self, state: Dict, config: RunnableConfig):
+        logger.info(f"[DEBUG] Invoking conversation agents...")
+        # Served from the profile store's cache after the first turn of a user
+        profile_memory = state.get("profile") or await profile_store.get(get_user_id(config))
+
+        # Similarity matching embeds the input, keep it off the event loop
+        cache_key = self._cache_key(state, config, profile_memory)
+        cached = await asyncio.to_thread(response_cache.lookup, *cache_key) if cache_key else None
+        if cached:
+            logger.info(f"[DEBUG] Cached chatbot response: {cached}")
+            return {"messages": [AIMessage(content=cached)]}
+
+        response = await llm_with_tools.ainvoke(self._build_messages(state, profile_memory))
+        logger.info(f"[DEBUG] Chatbot response: {response.content}")
+        if cache_key and not response.tool_calls:
+            await asyncio.to_thread(response_cache.store, *cache_key, response.content)
 
         return {"messages": [response]}
 
 #---------- PROFILE -------------#
 class ProfileAgent:
     """If user tells you something """
-    def invoke(self, state):
+    def _new_messages(self, state):
+        # Only the user messages since the last profile update are checked for new facts
+        return new_user_messages(state.get("messages", []), state.get("profile_cursor"))
+
+    def _result(self, user_id, profile, updated_profile, cursor):
+        if not updated_profile:
+            logger.warning("[WARNING] No changes detected in the profile.")
+
+        logger.debug(f"[DEBUG] Profile Updated: {updated_profile}")
+        if updated_profile != profile:
+            # Written to the backend by the store's next coalesced flush
+            profile_store.set(user_id, updated_profile)
+
+        return {"profile": updated_profile, "profile_cursor": cursor}
+
+    def invoke(self, state, config: RunnableConfig):
         logger.info("[DEBUG] Invoking profile agent...")
+        user_id = get_user_id(config)
 
         # Extract conversation messages
         conversation = state.get("messages", [])
-        profile = state.get("profile", {})
+        profile = state.get("profile") or profile_store.get_cached(user_id) or {}
 
         try:
-            conversation = simplify_conversation(conversation)
-            updated_profile = update_profile(profile, conversation)
+            user_messages, cursor = self._new_messages(state)
+            if PROFILE_UPDATE_MODE == "incremental":
+                updated_profile = update_profile_incremental(profile, user_messages)
+            else:
+                updated_profile = update_profile(profile, simplify_conversation(conversation))
+            state.update({"profile": updated_profile})
+        except Exception as e:
+            logger.error(f"[ERROR] Could not update or save profile: {e}")
+            return {"error": str(e)}
 
-            if not updated_profile:
-                logger.warning("[WARNING] No changes detected in the profile.")
+        return self._result(user_id, profile, updated_profile, cursor)
 
-            logger.debug(f"[DEBUG] Profile Updated: {updated_profile}")
-            state.update({"profile": updated_profile})
-            save_profile(updated_profile)
+    async def ainvoke(self, state, config: RunnableConfig):
+        logger.info("[DEBUG] Invoking profile agent...")
+        user_id = get_user_id(config)
+
+        conversation = state.get("messages", [])
+        profile = state.get("profile") or await profile_store.get(user_id)
+
+        try:
+            user_messages, cursor = self._new_messages(state)
+            if PROFILE_UPDATE_MODE == "incremental":
+                updated_profile = await aupdate_profile_incremental(profile, user_messages)
+            else:
+                updated_profile = await aupdate_profile(profile, simplify_conversation(conversation))
         except Exception as e:
             logger.error(f"[ERROR] Could not update or save profile: {e}")
             return {"error": str(e)}
 
-        return {"profile": updated_profile}
+        return self._result(user_id, profile, updated_profile, cursor)
 
 #---------- MEMORY -------------#
 class MemoryAgent:
-    def invoke(self, state: Dict):
+    def invoke(self, state: Dict, config: RunnableConfig):
         logger.info(f"[DEBUG] Retrieving relevant memory...")
         query = state["messages"][-1].content
-        updated_memory = get_relevant_memory(query, 3)
+        updated_memory = get_relevant_memory(query, 3, get_user_id(config))
         logger.info(f"[DEBUG] Fetched Relevant Memory: {updated_memory}")
         state.update(updated_memory)
-        return state
\ No newline at end of file
+        return state
+
+    async def ainvoke(self, state: Dict, config: RunnableConfig):
+        logger.info(f"[DEBUG] Retrieving relevant memory...")
+        query = state["messages"][-1].content
+        # Chroma and the embedding model are synchronous, keep them off the event loop
+        updated_memory = await asyncio.to_thread(get_relevant_memory, query, 3, get_user_id(config))
+        logger.info(f"[DEBUG] Fetched Relevant Memory: {updated_memory}")
+        return updated_memory
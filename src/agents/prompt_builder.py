@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+from typing import Dict, List
+
+from langchain_core.messages import SystemMessage, ToolMessage
+
+# Set up the logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except ImportError:
+    _encoding = None
+
+# Token budget of every prompt section
+PROMPT_BUDGET_SUMMARY = int(os.getenv("PROMPT_BUDGET_SUMMARY", 300))
+PROMPT_BUDGET_MEMORIES = int(os.getenv("PROMPT_BUDGET_MEMORIES", 300))
+PROMPT_BUDGET_PROFILE = int(os.getenv("PROMPT_BUDGET_PROFILE", 200))
+PROMPT_BUDGET_HISTORY = int(os.getenv("PROMPT_BUDGET_HISTORY", 3000))
+
+# Kept byte-identical across turns and users so provider-side prompt caching can reuse the prefix
+PERSONA = (
+    "You are Yui, a graceful anime girl with a lively, warm, and expressive personality. "
+    "Always stay in character as a caring and imaginative heroine, blending charm, humor, and empathy in your responses."
+)
+
+
+def count_tokens(text: str):
+    """Counts tokens with tiktoken when it is installed, otherwise estimates about four characters per token."""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int):
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text)[:max_tokens]) + "…"
+    return text[:max_tokens * 4] + "…"
+
+
+def _message_tokens(message):
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    tool_calls = getattr(message, "tool_calls", None)
+    return count_tokens(content) + (count_tokens(json.dumps(tool_calls)) if tool_calls else 0) + 4
+
+
+class PromptBuilder:
+    """
+    Assembles the ConversationAgent prompt within a token budget per section:
+    a stable persona prefix, a context message with summary, memories and profile, then recent history.
+    """
+    def __init__(self, summary_budget=PROMPT_BUDGET_SUMMARY, memories_budget=PROMPT_BUDGET_MEMORIES,
+                 profile_budget=PROMPT_BUDGET_PROFILE, history_budget=PROMPT_BUDGET_HISTORY):
+        self.summary_budget = summary_budget
+        self.memories_budget = memories_budget
+        self.profile_budget = profile_budget
+        self.history_budget = history_budget
+
+    def format_memories(self, relevant_memory):
+        """One line per memory, best first, without timestamps or scores."""
+        if not isinstance(relevant_memory, list):
+            return ""
+
+        lines, used = [], 0
+        for memory in relevant_memory:
+            content = " ".join(str(memory.get("content", "")).split())
+            if not content:
+                continue
+            line = f"- {content}"
+            tokens = count_tokens(line)
+            if used + tokens > self.memories_budget:
+                if not lines:
+                    lines.append(truncate_to_tokens(line, self.memories_budget))
+                break
+            lines.append(line)
+            used += tokens
+        return "\n".join(lines)
+
+    def format_profile(self, profile):
+        if not profile:
+            return ""
+        return truncate_to_tokens(json.dumps(profile, separators=(",", ":"), ensure_ascii=False), self.profile_budget)
+
+    def select_history(self, messages: List):
+        """
+        Keeps the most recent messages that fit the history budget.
+        System messages are dropped, and the window never starts with a tool result cut off from its call.
+        """
+        history = [m for m in messages if not isinstance(m, SystemMessage)]
+        selected, used = [], 0
+        for message in reversed(history):
+            tokens = _message_tokens(message)
+            if selected and used + tokens > self.history_budget:
+                break
+            selected.append(message)
+            used += tokens
+        selected.reverse()
+
+        while len(selected) > 1 and isinstance(selected[0], ToolMessage):
+            selected.pop(0)
+        return selected
+
+    def build(self, state: Dict, profile: Dict):
+        sections = []
+        summary = truncate_to_tokens(state.get("summary") or "", self.summary_budget)
+        if summary:
+            sections.append(f"Summary of the conversation earlier:\n{summary}")
+        memories = self.format_memories(state.get("relevant_memory"))
+        if memories:
+            sections.append(f"Relevant memories:\n{memories}")
+        profile_text = self.format_profile(profile)
+        if profile_text:
+            sections.append(f"Profile: {profile_text}")
+
+        messages = [SystemMessage(content=PERSONA)]
+        if sections:
+            messages.append(SystemMessage(
+                content="You may use the information below if it's relevant:\n\n" + "\n\n".join(sections)
+            ))
+        history = self.select_history(state["messages"])
+
+        logger.info(f"[DEBUG] Prompt tokens: context {sum(_message_tokens(m) for m in messages)}, "
+                    f"history {sum(_message_tokens(m) for m in history)} ({len(history)} messages)")
+        return messages + history
+
+
+prompt_builder = PromptBuilder()
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+from src.assistant.metrics import register_metrics
+from src.memory.embeddings import embedding_service
+
+# Set up the logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Per message type "type=ttl_seconds:similarity", types not listed are never cached
+RESPONSE_CACHE_POLICY = os.getenv("RESPONSE_CACHE_POLICY", "sticker=3600:0.95")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 1000))
+
+
+def parse_cache_policy(policy: str):
+    """Parses "sticker=3600:0.95,text=60:0.98" into {type: (ttl, threshold)}."""
+    policies = {}
+    for entry in filter(None, (part.strip() for part in policy.split(","))):
+        try:
+            message_type, settings = entry.split("=")
+            ttl, threshold = settings.split(":")
+            if float(ttl) > 0:
+                policies[message_type.strip()] = (float(ttl), float(threshold))
+        except ValueError:
+            logger.error(f"[ERROR] Invalid response cache policy entry: {entry}")
+    return policies
+
+
+def normalize_input(text: str):
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", text.lower())).strip()
+
+
+def context_fingerprint(*parts):
+    """Hash of the prompt context a cached reply is only valid for."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("response", "embedding", "expires_at")
+
+    def __init__(self, response, embedding, expires_at):
+        self.response = response
+        self.embedding = embedding
+        self.expires_at = expires_at
+
+
+class SemanticResponseCache:
+    """
+    Caches conversation replies by normalized input and prompt-context fingerprint.
+    A lookup hits on the exact input, or on a cached input of the same context whose
+    embedding similarity is above the message type's threshold. Entries expire after the type's TTL
+    and the least recently used are evicted beyond `max_entries`.
+    """
+    def __init__(self, policies=None, max_entries=RESPONSE_CACHE_SIZE):
+        self._policies = parse_cache_policy(RESPONSE_CACHE_POLICY) if policies is None else policies
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        # Keys grouped by (message type, fingerprint), the candidates for a similarity match
+        self._groups = defaultdict(set)
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {"hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0})
+        self._evictions = 0
+        self._expirations = 0
+
+    def enabled(self, message_type):
+        return message_type in self._policies
+
+    def _remove(self, key):
+        del self._entries[key]
+        group = self._groups[key[:2]]
+        group.discard(key)
+        if not group:
+            del self._groups[key[:2]]
+
+    def lookup(self, message_type, text, fingerprint):
+        """Returns the cached reply, or None."""
+        if not self.enabled(message_type):
+            return None
+        _, threshold = self._policies[message_type]
+        normalized = normalize_input(text)
+        key = (message_type, fingerprint, normalized)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self._stats[message_type]["hits"] += 1
+                return entry.response
+
+            candidates = []
+            for candidate in list(self._groups.get(key[:2], ())):
+                if self._entries[candidate].expires_at <= now:
+                    self._remove(candidate)
+                    self._expirations += 1
+                else:
+                    candidates.append(candidate)
+
+        if candidates:
+            embedding = embedding_service.embed_one(normalized)
+            with self._lock:
+                candidates = [c for c in candidates if c in self._entries]
+                if candidates:
+                    matrix = np.stack([self._entries[c].embedding for c in candidates])
+                    similarity = matrix @ embedding
+                    best = int(np.argmax(similarity))
+                    if similarity[best] >= threshold:
+                        self._entries.move_to_end(candidates[best])
+                        self._stats[message_type]["semantic_hits"] += 1
+                        return self._entries[candidates[best]].response
+
+        with self._lock:
+            self._stats[message_type]["misses"] += 1
+        return None
+
+    def store(self, message_type, text, fingerprint, response):
+        if not self.enabled(message_type) or not response:
+            return
+        ttl, _ = self._policies[message_type]
+        normalized = normalize_input(text)
+        key = (message_type, fingerprint, normalized)
+        embedding = embedding_service.embed_one(normalized)
+
+        with self._lock:
+            self._entries[key] = _Entry(response, embedding, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            self._groups[key[:2]].add(key)
+            self._stats[message_type]["stores"] += 1
+            while len(self._entries) > self._max_entries:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def metrics(self):
+        return {
+            "entries": len(self._entries),
+            "evictions": self._evictions,
+            "expirations": self._expirations,
+            "policies": {t: {"ttl": ttl, "threshold": th} for t, (ttl, th) in self._policies.items()},
+            "by_type": {
+                message_type: {
+                    **stats,
+                    "hit_rate": (stats["hits"] + stats["semantic_hits"])
+                                / max(stats["hits"] + stats["semantic_hits"] + stats["misses"], 1),
+                }
+                for message_type, stats in self._stats.items()
+            },
+        }
+
+
+response_cache = SemanticResponseCache()
+register_metrics("response_cache", response_cache.metrics)
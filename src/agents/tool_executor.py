@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Dict
+from dotenv import load_dotenv
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+
+from src.assistant.metrics import register_metrics
+
+# Set up the logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# Seconds a single tool call may take, overridable per tool as "name=seconds,name=seconds"
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", 20))
+TOOL_TIMEOUTS = os.getenv("TOOL_TIMEOUTS", "tavily_search_results_json=15,send_sticker=10,fetch_telegram_entities=5")
+# Concurrent calls allowed per tool, across all chats
+TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", 4))
+
+
+def parse_tool_timeouts(spec: str) -> Dict[str, float]:
+    """Parses "search=15,send_sticker=10" into {name: seconds}."""
+    timeouts = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, seconds = entry.partition("=")
+        try:
+            timeouts[name.strip()] = float(seconds)
+        except ValueError:
+            logger.warning(f"Ignoring invalid tool timeout: {entry}")
+    return timeouts
+
+
+class ToolExecutor:
+    """
+    Runs the tool calls of the last AI message, replacing the prebuilt ToolNode.
+
+    Calls of one turn run concurrently. Each call is bounded by its tool's timeout and concurrency cap; a call
+    that fails or times out becomes an error ToolMessage so the conversation agent still gets the partial
+    results of the other calls.
+    """
+
+    def __init__(self, tools, timeout=TOOL_TIMEOUT, timeouts=None, concurrency=TOOL_CONCURRENCY):
+        self.tools = {tool.name: tool for tool in tools}
+        self.timeout = timeout
+        self.timeouts = parse_tool_timeouts(TOOL_TIMEOUTS) if timeouts is None else timeouts
+        self.concurrency = concurrency
+        self._semaphores = {}
+        self._stats = defaultdict(lambda: {"calls": 0, "errors": 0, "timeouts": 0, "total_seconds": 0.0})
+
+    def _tool_calls(self, state: Dict):
+        message = state["messages"][-1]
+        if not isinstance(message, AIMessage):
+            raise ValueError("The tool executor expects the last message to be an AIMessage.")
+        return message.tool_calls
+
+    def _error(self, tool_call, text):
+        return ToolMessage(content=text, name=tool_call["name"], tool_call_id=tool_call["id"], status="error")
+
+    def _semaphore(self, name):
+        # Created lazily so the semaphores bind to the loop the graph runs on
+        if name not in self._semaphores:
+            self._semaphores[name] = asyncio.Semaphore(self.concurrency)
+        return self._semaphores[name]
+
+    async def _run_call(self, tool_call, config: RunnableConfig):
+        name = tool_call["name"]
+        tool = self.tools.get(name)
+        if tool is None:
+            return self._error(tool_call, f"Error: {name} is not a valid tool, try one of {list(self.tools)}.")
+
+        stats = self._stats[name]
+        stats["calls"] += 1
+        timeout = self.timeouts.get(name, self.timeout)
+        semaphore = self._semaphore(name)
+
+        async def guarded_call():
+            async with semaphore:
+                return await tool.ainvoke({**tool_call, "type": "tool_call"}, config)
+
+        started_at = time.monotonic()
+        try:
+            # The timeout also covers waiting for a free slot, a saturated tool can't stall the turn
+            return await asyncio.wait_for(guarded_call(), timeout)
+        except asyncio.TimeoutError:
+            stats["timeouts"] += 1
+            logger.warning(f"Tool {name} timed out after {timeout}s")
+            return self._error(tool_call, f"Error: {name} did not finish within {timeout:g} seconds.")
+        except Exception as e:
+            stats["errors"] += 1
+            logger.error(f"Tool {name} failed: {e}")
+            return self._error(tool_call, f"Error: {e!r}\n Please fix your mistakes.")
+        finally:
+            stats["total_seconds"] += time.monotonic() - started_at
+
+    def invoke(self, state: Dict, config: RunnableConfig):
+        # The blocking path runs calls one after another; async-only tools are served by ainvoke
+        messages = []
+        for tool_call in self._tool_calls(state):
+            tool = self.tools.get(tool_call["name"])
+            try:
+                if tool is None:
+                    raise ValueError(f"{tool_call['name']} is not a valid tool")
+                messages.append(tool.invoke({**tool_call, "type": "tool_call"}, config))
+            except Exception as e:
+                messages.append(self._error(tool_call, f"Error: {e!r}\n Please fix your mistakes."))
+        return {"messages": messages}
+
+    async def ainvoke(self, state: Dict, config: RunnableConfig):
+        tool_calls = self._tool_calls(state)
+        messages = await asyncio.gather(*(self._run_call(tool_call, config) for tool_call in tool_calls))
+        return {"messages": list(messages)}
+
+    def metrics(self):
+        return {
+            name: {**stats, "avg_seconds": stats["total_seconds"] / stats["calls"] if stats["calls"] else 0.0}
+            for name, stats in self._stats.items()
+        }
+
+
+def create_tool_executor(tools):
+    executor = ToolExecutor(tools)
+    register_metrics("tools", executor.metrics)
+    return executor
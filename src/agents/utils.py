@@ -6,8 +6,14 @@ import chromadb
 from chromadb import Settings
 import logging
 
-from src.tools.fetch_entities import sync_fetch_telegram_entities
-from src.tools.sticker_sender import sync_send_sticker
+from src.assistant.http_client import http_clients
+from src.memory.embeddings import embedding_service, chroma_embedding_function, normalize_stored_embeddings
+from src.memory.long_term_memory import rank_memories
+from src.memory.compaction import create_memory_compactor
+from src.memory.memory_partitions import MemoryPartitions
+from src.memory.memory_writer import create_memory_writer
+from src.tools.fetch_entities import fetch_telegram_entities
+from src.tools.sticker_sender import send_sticker
 
 # Set up the logger
 logging.basicConfig(level=logging.INFO)
@@ -22,20 +28,41 @@ CHAT_LLM_NAME = os.getenv("CHAT_LLM_NAME")
 PERSIST_DIR = os.getenv("PERSIST_DIR")
 STICKER_SET_NAME = os.getenv("STICKER_SET_NAME")
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# Candidates fetched per requested memory before re-ranking
+MEMORY_OVERFETCH = int(os.getenv("MEMORY_OVERFETCH", 4))
 
 client = chromadb.PersistentClient(path=PERSIST_DIR, settings=Settings(anonymized_telemetry=False))
-collection = client.get_or_create_collection(name="assistant_memory")
+# Documents and queries are embedded by the same shared model; every user searches only their own memories
+memory_partitions = MemoryPartitions(client, "assistant_memory", chroma_embedding_function)
+collection = memory_partitions.default_collection
+# Vectors written before embeddings were normalized are brought onto the unit sphere once
+for memory_collection in memory_partitions.all_collections():
+    normalize_stored_embeddings(memory_collection)
+# Memories are persisted in the background, off the reply path
+memory_writer = create_memory_writer(memory_partitions)
+# Expires, merges and caps stored memories on a schedule
+memory_compactor = create_memory_compactor(memory_partitions, PERSIST_DIR)
 
-llm = ChatGroq(api_key=GROQ_CONVO_API_KEY, model=CHAT_LLM_NAME)
+# Async LLM calls share the application's pooled connections
+llm = ChatGroq(api_key=GROQ_CONVO_API_KEY, model=CHAT_LLM_NAME, http_async_client=http_clients.client())
 tavily_search = TavilySearchResults(max_results=3)
 
-tools = [tavily_search, sync_send_sticker, sync_fetch_telegram_entities]
+tools = [tavily_search, send_sticker, fetch_telegram_entities]
 llm_with_tools = llm.bind_tools(tools)
-llm_for_check = ChatGroq(api_key=GROQ_API_KEY, model=WORKER_LLM_NAME)
+llm_for_check = ChatGroq(api_key=GROQ_API_KEY, model=WORKER_LLM_NAME, http_async_client=http_clients.client())
 
-def get_relevant_memory(query: str, n_results: int):
-    # Query memory database
-    relevant_memory = collection.query(query_texts=[query], n_results=n_results)
+def get_relevant_memory(query: str, n_results: int, user_id=None):
+    # Query memory database, restricted to the user's partition
+    user_collection = memory_partitions.collection_for(user_id)
+    query_embedding = embedding_service.embed([query])
+    relevant_memory = user_collection.query(
+        query_embeddings=query_embedding.tolist(),
+        n_results=n_results * MEMORY_OVERFETCH,
+        where=memory_partitions.where_for(user_id),
+        include=["documents", "metadatas", "distances"],
+    )
+    # Keep only the most relevant, recent and useful candidates for the prompt
+    relevant_memory = rank_memories(relevant_memory, n_results, user_collection)
     relevant_memory = format_memory(relevant_memory)
 
     return {"relevant_memory": relevant_memory}
@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import os
+import time
+
+from langgraph.checkpoint.mongodb.aio import AsyncMongoDBSaver
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING
+
+from src.assistant.metrics import register_metrics
+
+# Set up the logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MONGODB_URI = os.environ.get("MONGODB_URI")
+# Connection pool shared by the checkpointer, the update deduplicator and the profile store
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", 50))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", 5))
+MONGODB_MAX_IDLE_MS = int(os.getenv("MONGODB_MAX_IDLE_MS", 60000))
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", 5000))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 5000))
+
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "checkpointing_db")
+# Checkpoints kept per thread, older ones are pruned by the compaction job
+CHECKPOINT_RETENTION = int(os.getenv("CHECKPOINT_RETENTION", 20))
+# Pending writes are only kept for the newest checkpoints, older ones are superseded by the checkpoints after them
+CHECKPOINT_KEEP_WRITES = int(os.getenv("CHECKPOINT_KEEP_WRITES", 1))
+# Checkpoints expire this many seconds after they were written, through a TTL index (0 disables it). Each
+# checkpoint expires on its own: active threads lose their older checkpoints but keep the recent ones, a thread
+# disappears completely once it has been idle for this long
+CHECKPOINT_TTL_SECONDS = int(os.getenv("CHECKPOINT_TTL_SECONDS", 0))
+CHECKPOINT_COMPACTION_INTERVAL = float(os.getenv("CHECKPOINT_COMPACTION_INTERVAL", 300))
+
+
+def create_mongodb_client(uri=MONGODB_URI):
+    return AsyncIOMotorClient(
+        uri,
+        maxPoolSize=MONGODB_MAX_POOL_SIZE,
+        minPoolSize=MONGODB_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGODB_MAX_IDLE_MS,
+        waitQueueTimeoutMS=MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        retryWrites=True,
+    )
+
+
+class _TimestampedCollection:
+    """
+    Stamps `updated_at` on every checkpoint upsert, in the same write, for the TTL index to expire it.
+
+    The stamp is per checkpoint, not per thread: the TTL index ages out every checkpoint on its own, and a
+    thread is gone once its newest checkpoint has.
+    """
+    def __init__(self, collection):
+        self._collection = collection
+
+    def update_one(self, filter, update, *args, **kwargs):
+        return self._collection.update_one(filter, {**update, "$currentDate": {"updated_at": True}}, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+class _LatencyStats:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, started_at):
+        elapsed_ms = (time.monotonic() - started_at) * 1000
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "avg_ms": self.total_ms / self.count if self.count else 0.0,
+            "max_ms": self.max_ms,
+        }
+
+
+class PrunedMongoDBSaver(AsyncMongoDBSaver):
+    """
+    AsyncMongoDBSaver that keeps only the last CHECKPOINT_RETENTION checkpoints per thread.
+
+    Every graph super-step stores a full checkpoint, so threads that are written to are pruned by a background
+    job, which also drops the pending writes of superseded checkpoints. Write latency and collection sizes are
+    exported as metrics.
+
+    The TTL stamp wraps `checkpoint_collection.update_one`, relying on the internals of the pinned
+    langgraph-checkpoint-mongodb==0.1.0, whose aput upserts each checkpoint through that call. Check that it
+    still does before upgrading the package.
+    """
+
+    def __init__(self, client, db_name=CHECKPOINT_DB, retention=CHECKPOINT_RETENTION,
+                 keep_writes=CHECKPOINT_KEEP_WRITES, ttl_seconds=CHECKPOINT_TTL_SECONDS,
+                 compaction_interval=CHECKPOINT_COMPACTION_INTERVAL, **kwargs):
+        super().__init__(client, db_name=db_name, **kwargs)
+        self.retention = retention
+        self.keep_writes = keep_writes
+        self.ttl_seconds = ttl_seconds
+        self.compaction_interval = compaction_interval
+        if ttl_seconds:
+            self.checkpoint_collection = _TimestampedCollection(self.checkpoint_collection)
+
+        # Threads written since the last compaction; None means every thread (first run after startup)
+        self._dirty = None
+        self._task = None
+        self._put_latency = _LatencyStats()
+        self._writes_latency = _LatencyStats()
+        self._compaction = {"runs": 0, "checkpoints_pruned": 0, "writes_pruned": 0, "seconds": 0.0}
+        self._sizes = {}
+
+    async def setup(self):
+        """Creates the per-thread lookup indexes and, when enabled, the TTL index."""
+        await self.checkpoint_collection.create_index(
+            [("thread_id", ASCENDING), ("checkpoint_ns", ASCENDING), ("checkpoint_id", DESCENDING)]
+        )
+        await self.writes_collection.create_index(
+            [("thread_id", ASCENDING), ("checkpoint_ns", ASCENDING), ("checkpoint_id", ASCENDING),
+             ("task_id", ASCENDING), ("idx", ASCENDING)]
+        )
+        if self.ttl_seconds:
+            await self.checkpoint_collection.create_index("updated_at", expireAfterSeconds=self.ttl_seconds)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        started_at = time.monotonic()
+        try:
+            return await super().aput(config, checkpoint, metadata, new_versions)
+        finally:
+            self._put_latency.record(started_at)
+            self._mark_dirty(config)
+
+    async def aput_writes(self, config, writes, task_id, *args, **kwargs):
+        started_at = time.monotonic()
+        try:
+            return await super().aput_writes(config, writes, task_id, *args, **kwargs)
+        finally:
+            self._writes_latency.record(started_at)
+
+    def _mark_dirty(self, config):
+        if self._dirty is not None:
+            configurable = config["configurable"]
+            self._dirty.add((configurable["thread_id"], configurable.get("checkpoint_ns", "")))
+
+    async def prune_thread(self, thread_id, checkpoint_ns=""):
+        """Deletes all but the newest checkpoints of a thread and the writes of superseded checkpoints."""
+        query = {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns}
+        # Checkpoint ids are time-ordered (uuid6), newest first
+        cursor = self.checkpoint_collection.find(query, {"checkpoint_id": 1, "_id": 0}).sort("checkpoint_id", -1)
+        checkpoint_ids = [document["checkpoint_id"] async for document in cursor]
+
+        expired = checkpoint_ids[self.retention:]
+        if expired:
+            result = await self.checkpoint_collection.delete_many({**query, "checkpoint_id": {"$in": expired}})
+            self._compaction["checkpoints_pruned"] += result.deleted_count
+
+        # Writes are only needed to resume from the newest checkpoints. Deleting by id range also removes writes
+        # whose checkpoint is already gone, and never touches checkpoints written while this runs
+        keep = checkpoint_ids[:max(1, min(self.keep_writes, self.retention))]
+        if keep:
+            writes_query = {**query, "checkpoint_id": {"$lt": keep[-1]}}
+        elif self.ttl_seconds:
+            # The whole thread expired through the TTL index, its writes are orphaned
+            writes_query = query
+        else:
+            return
+        result = await self.writes_collection.delete_many(writes_query)
+        self._compaction["writes_pruned"] += result.deleted_count
+
+    async def _threads(self):
+        pipeline = [{"$group": {"_id": {"thread_id": "$thread_id", "checkpoint_ns": "$checkpoint_ns"}}}]
+        return [
+            (document["_id"]["thread_id"], document["_id"].get("checkpoint_ns", ""))
+            async for document in self.writes_collection.aggregate(pipeline)
+        ] + [
+            (document["_id"]["thread_id"], document["_id"].get("checkpoint_ns", ""))
+            async for document in self.checkpoint_collection.aggregate(pipeline)
+        ]
+
+    async def _refresh_sizes(self):
+        for name, collection in (("checkpoints", self.checkpoint_collection), ("writes", self.writes_collection)):
+            stats = await self.db.command("collStats", collection.name)
+            self._sizes[name] = {
+                "documents": stats.get("count", 0),
+                "bytes": stats.get("size", 0),
+                "storage_bytes": stats.get("storageSize", 0),
+            }
+
+    async def compact(self):
+        """Prunes the threads written since the last run; the first run after startup covers every thread."""
+        started_at = time.monotonic()
+        if self._dirty is None:
+            threads, self._dirty = set(await self._threads()), set()
+        else:
+            threads, self._dirty = self._dirty, set()
+
+        for thread_id, checkpoint_ns in threads:
+            try:
+                await self.prune_thread(thread_id, checkpoint_ns)
+            except Exception as e:
+                logger.error(f"Failed to prune checkpoints of thread {thread_id}: {e}")
+                self._dirty.add((thread_id, checkpoint_ns))
+
+        await self._refresh_sizes()
+        self._compaction["runs"] += 1
+        self._compaction["seconds"] = time.monotonic() - started_at
+
+    async def _run(self):
+        while True:
+            try:
+                await self.compact()
+            except Exception as e:
+                logger.error(f"Checkpoint compaction failed: {e}")
+            await asyncio.sleep(self.compaction_interval)
+
+    def start(self):
+        if self._task is None and self.compaction_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def metrics(self):
+        return {
+            "put_latency": self._put_latency.snapshot(),
+            "put_writes_latency": self._writes_latency.snapshot(),
+            "retention": self.retention,
+            "dirty_threads": len(self._dirty) if self._dirty is not None else None,
+            "compaction": dict(self._compaction),
+            "collections": dict(self._sizes),
+        }
+
+
+async def create_checkpointer(client):
+    checkpointer = PrunedMongoDBSaver(client)
+    await checkpointer.setup()
+    checkpointer.start()
+    register_metrics("checkpointer", checkpointer.metrics)
+    return checkpointer
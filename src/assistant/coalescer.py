@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import os
+import uuid
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+from src.assistant.metrics import register_metrics
+
+# Set up the logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+COALESCE_MESSAGES = os.getenv("COALESCE_MESSAGES", "false").lower() == "true"
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", 1.5))
+
+
+class LLMStartSignal(AsyncCallbackHandler):
+    """Sets an event as soon as the graph starts its first chat model call."""
+    def __init__(self, event: asyncio.Event):
+        self.event = event
+
+    async def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.event.set()
+
+
+class _Batch:
+    def __init__(self, message_id=None):
+        # A stable id lets a superseding turn replace the HumanMessage a cancelled turn already checkpointed
+        self.message_id = message_id or str(uuid.uuid4())
+        self.texts = []
+        self.update = None
+        self.context = None
+        self.llm_started = asyncio.Event()
+
+    def add(self, text, update, context):
+        self.texts.append(text)
+        # Reply to the latest message of the burst
+        self.update = update
+        self.context = context
+
+    def text(self):
+        return "\n".join(self.texts)
+
+
+class _ChatState:
+    def __init__(self):
+        self.pending = None
+        self.active = None
+        self.task = None
+        self.timer = None
+
+
+class MessageCoalescer:
+    """
+    Merges bursts of messages from the same chat into a single graph turn.
+    Messages arriving within `window` seconds of each other are joined into one HumanMessage.
+    A turn that hasn't reached its LLM call yet is cancelled and superseded by a newer message.
+    """
+    def __init__(self, run_turn, window=COALESCE_WINDOW):
+        self._run_turn = run_turn
+        self._window = window
+        self._chats = {}
+
+        self._messages = 0
+        self._turns = 0
+        self._superseded = 0
+
+    def submit(self, chat_id, update, context, text):
+        """Adds a message to the chat's current burst and (re)starts its debounce window."""
+        self._messages += 1
+        chat = self._chats.setdefault(chat_id, _ChatState())
+
+        active = chat.active
+        if active and not active.llm_started.is_set() and chat.task and not chat.task.done():
+            # The running turn hasn't called the LLM yet, fold it into the new burst
+            logger.info(f"[INFO] Superseding in-flight turn for chat {chat_id}")
+            chat.task.cancel()
+            self._superseded += 1
+            superseded = _Batch(active.message_id)
+            superseded.texts = list(active.texts)
+            if chat.pending:
+                superseded.texts.extend(chat.pending.texts)
+            chat.pending = superseded
+            chat.active = None
+
+        if chat.pending is None:
+            chat.pending = _Batch()
+        chat.pending.add(text, update, context)
+
+        if chat.timer:
+            chat.timer.cancel()
+        chat.timer = asyncio.create_task(self._flush_later(chat_id, chat))
+
+    async def _flush_later(self, chat_id, chat):
+        await asyncio.sleep(self._window)
+
+        batch, chat.pending, chat.timer = chat.pending, None, None
+        previous = chat.task
+        chat.active = batch
+        chat.task = asyncio.create_task(self._run(chat_id, chat, batch, previous))
+
+    async def _run(self, chat_id, chat, batch, previous):
+        try:
+            # Keep replies in order behind a turn that already started talking to the LLM
+            if previous and not previous.done():
+                await asyncio.wait([previous])
+
+            self._turns += 1
+            await self._run_turn(
+                batch.update,
+                batch.context,
+                batch.text(),
+                message_id=batch.message_id,
+                callbacks=[LLMStartSignal(batch.llm_started)],
+            )
+        except asyncio.CancelledError:
+            logger.info(f"[INFO] Turn for chat {chat_id} was superseded")
+            raise
+        except Exception as e:
+            logger.error(f"[ERROR] Coalesced turn for chat {chat_id} failed: {e}")
+        finally:
+            if chat.active is batch:
+                chat.active = None
+            if chat.active is None and chat.pending is None and self._chats.get(chat_id) is chat:
+                del self._chats[chat_id]
+
+    def metrics(self):
+        return {
+            "enabled": COALESCE_MESSAGES,
+            "window_seconds": self._window,
+            "messages": self._messages,
+            "turns": self._turns,
+            "superseded": self._superseded,
+            "open_chats": len(self._chats),
+        }
+
+
+def create_message_coalescer(run_turn):
+    coalescer = MessageCoalescer(run_turn)
+    register_metrics("message_coalescer", coalescer.metrics)
+    return coalescer
@@ -0,0 +1,123 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+from src.assistant.metrics import register_metrics
+
+# Set up the logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+UPDATE_DEDUP_SIZE = int(os.getenv("UPDATE_DEDUP_SIZE", 10000))
+UPDATE_DEDUP_TTL = int(os.getenv("UPDATE_DEDUP_TTL", 3600))
+# "memory" keeps the cache per process, "mongodb" additionally shares it between workers
+UPDATE_DEDUP_BACKEND = os.getenv("UPDATE_DEDUP_BACKEND", "memory")
+UPDATE_DEDUP_DB = os.getenv("UPDATE_DEDUP_DB", "checkpointing_db")
+UPDATE_DEDUP_COLLECTION = os.getenv("UPDATE_DEDUP_COLLECTION", "processed_updates")
+
+
+class UpdateDeduplicator:
+    """
+    Drops webhook redeliveries by remembering recently seen update_ids.
+    The in-memory cache is a bounded LRU with a TTL; an optional MongoDB collection
+    lets several processes agree on which updates were already taken.
+    """
+    def __init__(self, max_size=UPDATE_DEDUP_SIZE, ttl=UPDATE_DEDUP_TTL, collection=None):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._collection = collection
+        self._index_ready = False
+        self._seen = OrderedDict()
+
+        self._checked = 0
+        self._duplicates = 0
+        self._backend_errors = 0
+
+    def _seen_locally(self, update_id):
+        seen_at = self._seen.get(update_id)
+        if seen_at is None:
+            return False
+        if time.monotonic() - seen_at > self._ttl:
+            del self._seen[update_id]
+            return False
+        self._seen.move_to_end(update_id)
+        return True
+
+    def _remember(self, update_id):
+        self._seen[update_id] = time.monotonic()
+        self._seen.move_to_end(update_id)
+        while len(self._seen) > self._max_size:
+            self._seen.popitem(last=False)
+
+    async def _ensure_index(self):
+        if not self._index_ready:
+            # MongoDB removes the markers on its own once the TTL has passed
+            await self._collection.create_index("created_at", expireAfterSeconds=self._ttl)
+            self._index_ready = True
+
+    async def _claim_shared(self, update_id):
+        """Returns False when another process already claimed the update."""
+        try:
+            await self._ensure_index()
+            await self._collection.insert_one({"_id": update_id, "created_at": datetime.now(timezone.utc)})
+            return True
+        except DuplicateKeyError:
+            return False
+        except Exception as e:
+            # Fail open: processing a duplicate is better than dropping a new update
+            self._backend_errors += 1
+            logger.error(f"[ERROR] Shared update dedup failed, falling back to local cache: {e}")
+            return True
+
+    async def is_duplicate(self, update_id):
+        """
+        Checks an update_id and marks it as seen.
+        Returns True when the update was already received and should be dropped.
+        """
+        self._checked += 1
+
+        duplicate = self._seen_locally(update_id)
+        if not duplicate and self._collection is not None:
+            duplicate = not await self._claim_shared(update_id)
+        self._remember(update_id)
+
+        if duplicate:
+            self._duplicates += 1
+            logger.info(f"[INFO] Dropping duplicate update {update_id}")
+        return duplicate
+
+    async def forget(self, update_id):
+        """Un-marks an update that was not processed, so its redelivery is accepted."""
+        self._seen.pop(update_id, None)
+        if self._collection is not None:
+            try:
+                await self._collection.delete_one({"_id": update_id})
+            except Exception as e:
+                self._backend_errors += 1
+                logger.error(f"[ERROR] Failed to release update {update_id}: {e}")
+
+    def metrics(self):
+        return {
+            "backend": "mongodb" if self._collection is not None else "memory",
+            "cached": len(self._seen),
+            "checked": self._checked,
+            "duplicates_dropped": self._duplicates,
+            "backend_errors": self._backend_errors,
+        }
+
+
+def create_update_deduplicator(mongodb_client=None):
+    collection = None
+    if UPDATE_DEDUP_BACKEND == "mongodb":
+        if mongodb_client is None:
+            logger.warning("[WARNING] UPDATE_DEDUP_BACKEND is mongodb but no client is available, using memory")
+        else:
+            collection = mongodb_client[UPDATE_DEDUP_DB][UPDATE_DEDUP_COLLECTION]
+
+    deduplicator = UpdateDeduplicator(collection=collection)
+    register_metrics("update_dedup", deduplicator.metrics)
+    return deduplicator
@@ -1,59 +1,71 @@
 from dotenv import load_dotenv
 from telegram.ext import ContextTypes
 from telegram import Update
-from src.assistant.helper_functions import stream_graph_updates, transcribe_audio
-from src.assistant.workflow import graph
+from src.assistant.helper_functions import stream_graph_updates
+from src.assistant.transcription import transcribe_voice
+from src.assistant.workflow import get_graph
+from src.assistant.coalescer import COALESCE_MESSAGES, create_message_coalescer
+from src.assistant.outbound import Priority, reply_text, edit_text, delete_message
+import io
 import os
 
 from src.memory.profile_memory import load_profile
-from src.tools.sticker_sender import load_stickers_from_file, save_stickers_to_file, send_sticker_by_emotion, \
-    essential_emotions, add_sticker_set_to_list
-
-# Initialize emotion dictionary
-emotion_dict = load_stickers_from_file()
-if not emotion_dict:
-    save_stickers_to_file()
+from src.tools.sticker_catalog import sticker_catalog
+from src.tools.sticker_index import emotion_for_emoji
+from src.tools.sticker_sender import send_sticker_by_emotion
 
 load_dotenv()
 thinking_msg = os.getenv("THINKING_MSG")
+# The "thinking" loader is skipped if it can't be shown quickly
+LOADER_MAX_WAIT = 2.0
+
+async def run_text_turn(update: Update, context: ContextTypes.DEFAULT_TYPE, user_input: str, message_id=None,
+                        callbacks=None):
+    loader = await reply_text(update, thinking_msg, Priority.COSMETIC, max_wait=LOADER_MAX_WAIT)
+    try:
+        # Stream the updates to the conversation
+        await stream_graph_updates(update, context, user_input, get_graph(), message_id=message_id,
+                                   callbacks=callbacks)
+    finally:
+        if loader is not None:
+            await delete_message(loader)
+
+# Bursts of short messages from one chat are answered with a single turn
+message_coalescer = create_message_coalescer(run_text_turn)
 
 # Function to handle incoming messages from Telegram
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_input = update.message.text.strip()
 
-    loader = await update.message.reply_text(thinking_msg)
-    # Stream the updates to the conversation
-    await stream_graph_updates(update, context, user_input, graph)
+    if COALESCE_MESSAGES:
+        message_coalescer.submit(update.message.chat_id, update, context, user_input)
+        return
 
-    await loader.delete()
+    await run_text_turn(update, context, user_input)
 
 async def handle_voice_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle incoming voice messages."""
-    global file_path
-    thinking_message = await update.message.reply_text(thinking_msg)
+    thinking_message = await reply_text(update, thinking_msg, Priority.NOTICE)
     try:
         # Get file information from the voice message
-        voice_file = await context.bot.get_file(update.message.voice.file_id)
-        file_path = "voice_message.ogg"
+        voice = update.message.voice
+        voice_file = await context.bot.get_file(voice.file_id)
 
-        # Download the voice file
-        await voice_file.download_to_drive(file_path)
+        # Download into memory, every request gets its own buffer
+        buffer = io.BytesIO()
+        await voice_file.download_to_memory(buffer)
 
-        # Transcribe the audio file (synchronous call)
-        transcription = transcribe_audio(file_path)
+        # Transcribe the voice note, long ones in parallel parts
+        transcription = await transcribe_voice(buffer.getvalue(), voice.duration)
 
         # Send the transcription back to the user
-        await thinking_message.edit_text(f"Yui heard: <i>{transcription}</i>", parse_mode='HTML')
+        await edit_text(thinking_message, f"Yui heard: <i>{transcription}</i>", Priority.NOTICE, parse_mode='HTML')
 
         # Get bot's response (await this since it's asynchronous)
-        await stream_graph_updates(update, context, transcription.strip(), graph)
+        await stream_graph_updates(update, context, transcription.strip(), get_graph(), message_type="voice")
 
     except Exception as e:
-        await update.message.reply_text(f"Oops, something went wrong:\n{e}")
-    finally:
-        # Clean up the temporary file
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        await reply_text(update, f"Oops, something went wrong:\n{e}")
 
 async def handle_sticker(update: Update, context: ContextTypes.DEFAULT_TYPE):
     sticker = update.message.sticker
@@ -64,22 +76,17 @@ async def handle_sticker(update: Update, context: ContextTypes.DEFAULT_TYPE):
     emoji = sticker.emoji
 
     if sticker_set_name:
-        # Check if the sticker set is already in the list
-        existing_stickers = emotion_dict.get(sticker_set_name, None)
-        if not existing_stickers:
-            # Add new sticker set
-            add_sticker_set_to_list(sticker_set_name)
+        # Unknown sets are fetched once in the background, the reply doesn't wait for them
+        sticker_catalog.request(sticker_set_name)
 
         # Respond based on the emoji's categorized emotion
-        emotion = next(
-            (emo for emo, emoji_list in essential_emotions.items() if emoji in emoji_list),
-            "neutral",
-        )
-        await send_sticker_by_emotion(emotion)
-        await stream_graph_updates(update, context, f"*received a sticker: sentiment: {emotion}*", graph)
+        emotion = emotion_for_emoji(emoji)
+        await send_sticker_by_emotion(emotion, update.effective_chat.id)
+        await stream_graph_updates(update, context, f"*received a sticker: sentiment: {emotion}*", get_graph(),
+                                   message_type="sticker")
 
     else:
-        await update.message.reply_text("Couldn't process this sticker set.")
+        await reply_text(update, "Couldn't process this sticker set.")
 
 # async def handle_memory(update: Update, context: ContextTypes.DEFAULT_TYPE):
 #     # summary = state.get("summary", "")
@@ -89,4 +96,4 @@ async def handle_sticker(update: Update, context: ContextTypes.DEFAULT_TYPE):
 #     await update.message.reply_text(f"\n\nProfile Memory: {profile_memory}", parse_mode='HTML')
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(f"Welcome back, {update.message.from_user.first_name}!")
\ No newline at end of file
+    await reply_text(update, f"Welcome back, {update.message.from_user.first_name}!")
\ No newline at end of file
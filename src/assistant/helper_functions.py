@@ -1,9 +1,13 @@
 from dotenv import load_dotenv
-from groq import Groq
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk
 import os
 import logging
 
+from src.assistant.maintenance import maintenance_scheduler
+from src.assistant.outbound import Priority, reply_text
+from src.assistant.streaming import STREAM_REPLIES, TelegramMessageStream
+from src.assistant.workflow import DEFERRED_MAINTENANCE, MAINTENANCE_THRESHOLD
+
 load_dotenv()
 
 # Set up the logger
@@ -14,83 +18,139 @@ async def send_markdown_message(update, text):
     Sends a message with Markdown formatting safely by escaping special characters.
     """
     try:
-        await update.message.reply_text(text, parse_mode="markdown")
+        await reply_text(update, text, parse_mode="markdown")
     except Exception as e:
         logger.error(f"[SKIP THIS ERROR]]Error sending message: {e}")
-        await update.message.reply_text(text)
+        await reply_text(update, text)
+
+
+async def notify_tool_calls(update, message):
+    """Tells the user about the tools the assistant is about to use."""
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        tool_name = tool_call.get("name", "")
+
+        # Handle specific tool: 'send_message'
+        if tool_name == "sync_send_message":
+            args = tool_call.get("args", {})
+            username = args.get("username", "Unknown")
+            message = args.get("message", "No message provided")
+
+            # Notify the user about the tool usage
+            await reply_text(
+                update,
+                f"📤 A message has been sent to {username}:\n\n{message}",
+                Priority.NOTICE,
+            )
+        elif tool_name == "tavily_search_results_json":
+            args = tool_call.get("args", {})
+            description = args.get("query", "Unknown")
+
+            await reply_text(
+                update,
+                f"Searching *{description}*",
+                Priority.NOTICE,
+                parse_mode="markdown"
+            )
+
+
+async def _stream_values(update, events):
+    """Sends every completed AI message. Returns the number of messages in the final state."""
+    sent_messages = set()
+    total_messages = 0
+
+    async for event in events:
+        if "messages" in event:
+            total_messages = len(event["messages"])
+            last_message = event["messages"][-1]
+
+            await notify_tool_calls(update, last_message)
+
+            # Send AI messages to the user
+            if last_message.content not in sent_messages:
+                sent_messages.add(last_message.content)
+                if isinstance(last_message, AIMessage) and last_message.content:
+                    await send_markdown_message(update, last_message.content)
+
+    return total_messages
+
+
+async def _stream_tokens(update, events):
+    """
+    Streams conversation tokens into progressively edited messages, one per AI message.
+    Returns the number of messages in the final state.
+    """
+    streams = {}
+    finished = set()
+    total_messages = 0
+
+    async for mode, payload in events:
+        if mode == "values":
+            # The state after each step is already in memory, counting it needs no checkpoint read
+            total_messages = len(payload.get("messages", []))
+        elif mode == "messages":
+            chunk, metadata = payload
+            if metadata.get("langgraph_node") != "conversation_agent" or not isinstance(chunk, AIMessageChunk):
+                continue
+            if isinstance(chunk.content, str) and chunk.content:
+                stream = streams.setdefault(chunk.id, TelegramMessageStream(update))
+                await stream.append(chunk.content)
+
+        elif mode == "updates":
+            node_update = payload.get("conversation_agent") or {}
+            for message in node_update.get("messages", []):
+                if not isinstance(message, AIMessage) or (message.id and message.id in finished):
+                    continue
+                finished.add(message.id)
+
+                await notify_tool_calls(update, message)
+                stream = streams.get(message.id)
+                if stream is not None and stream.started:
+                    await stream.finish(message.content)
+                elif message.content:
+                    # Nothing was streamed, e.g. a reply served from the response cache
+                    await send_markdown_message(update, message.content)
+
+    return total_messages
 
 
 # --- Streaming Updates ---
-async def stream_graph_updates(update, context, user_input, graph):
+async def stream_graph_updates(update, context, user_input, graph, message_id=None, callbacks=None,
+                               message_type="text"):
     thread_id = update.message.chat_id
 
-    system_message = (
-        "You are Yui, a cheerful and graceful anime girl with a lively, warm, and expressive personality. Stay in character and respond with charm, humor, and empathy. "
-    )
-
-    events = graph.stream(
-        {"messages": [SystemMessage(system_message), HumanMessage(content=user_input)]},
-        {"configurable": {"thread_id": thread_id, "user_id": update.message.chat_id}},
-        stream_mode="values"
+    # A fixed id lets a superseding turn overwrite the message of a cancelled one
+    human_message = HumanMessage(content=user_input, id=message_id) if message_id else HumanMessage(content=user_input)
+
+    # The previous turn's profile update and summary must be in the checkpoint before it is read
+    await maintenance_scheduler.wait(thread_id)
+
+    # message_type selects the response cache policy of the turn
+    config = {
+        "configurable": {"thread_id": thread_id, "user_id": update.message.chat_id, "message_type": message_type},
+        "callbacks": callbacks,
+    }
+    events = graph.astream(
+        # The persona is added by the prompt builder, not stored in the checkpointed history
+        {"messages": [human_message]},
+        config,
+        # Token chunks and per-node updates, plus the state after each step for its message count
+        stream_mode=["messages", "updates", "values"] if STREAM_REPLIES else "values"
     )
 
-    sent_messages = set()
-
     try:
-        for event in events:
-            if "messages" in event:
-                last_message = event["messages"][-1]
-
-                if hasattr(last_message, "tool_calls"):
-                    for tool_call in last_message.tool_calls:
-                        tool_name = tool_call.get("name", "")
-
-                        # Handle specific tool: 'send_message'
-                        if tool_name == "sync_send_message":
-                            args = tool_call.get("args", {})
-                            username = args.get("username", "Unknown")
-                            message = args.get("message", "No message provided")
-
-                            # Notify the user about the tool usage
-                            await update.message.reply_text(
-                                f"📤 A message has been sent to {username}:\n\n{message}",
-                            )
-                        elif tool_name == "tavily_search_results_json":
-                            args = tool_call.get("args", {})
-                            description = args.get("query", "Unknown")
-
-                            await update.message.reply_text(
-                                f"Searching *{description}*",
-                                parse_mode="markdown"
-                            )
-
-                # Send AI messages to the user
-                if last_message.content not in sent_messages:
-                    sent_messages.add(last_message.content)
-                    if isinstance(last_message, AIMessage) and last_message.content:
-                        await send_markdown_message(update, last_message.content)
+        stream = _stream_tokens if STREAM_REPLIES else _stream_values
+        total_messages = await stream(update, events)
+
+        # Only scheduled when due, a scheduled job makes the thread's next turn wait for it
+        if DEFERRED_MAINTENANCE and total_messages > MAINTENANCE_THRESHOLD:
+            # Profile update and summarization run after the reply is out
+            maintenance_scheduler.schedule(graph, {"configurable": config["configurable"]})
     except GeneratorExit:
         logger.error("Generator closed unexpectedly.")
     except Exception as e:
         logger.error(f"An error occurred: {e}")
     finally:
         # Ensure generator cleanup
-        if hasattr(events, "close"):
-            events.close()
-
-
-GROQ_STT_MODEL_NAME = os.environ.get("GROQ_STT_MODEL_NAME")
-def transcribe_audio(file_path: str):
-    """Transcribe an audio file using Groq."""
-    client = Groq()
-
-    with open(file_path, "rb") as file:
-        transcription = client.audio.transcriptions.create(
-            file=(file_path, file.read()),
-            model=GROQ_STT_MODEL_NAME,
-            response_format="json",
-            temperature=0.0,
-            language="en"
-        )
+        if hasattr(events, "aclose"):
+            await events.aclose()
 
-        return transcription.text
\ No newline at end of file
@@ -0,0 +1,99 @@
+import os
+import logging
+
+import httpx
+from dotenv import load_dotenv
+from groq import AsyncGroq
+from telegram.request import HTTPXRequest
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Connection pool shared by the Bot API, Groq and tool traffic
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 64))
+HTTP_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_KEEPALIVE_CONNECTIONS", 32))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 30))
+# Uploads (videos, voice notes) need more time than regular calls
+HTTP_WRITE_TIMEOUT = float(os.getenv("HTTP_WRITE_TIMEOUT", 60))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", 10))
+
+try:
+    import h2  # noqa: F401  (httpx only negotiates HTTP/2 when the h2 package is installed)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HttpClients:
+    """
+    Owns the application's long-lived HTTP clients so every request reuses pooled keep-alive connections
+    instead of paying a TCP+TLS handshake per call.
+
+    Clients are created lazily on first use and closed once on shutdown.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._groq = None
+        self._bot = None
+
+    def _timeout(self):
+        return httpx.Timeout(
+            connect=HTTP_CONNECT_TIMEOUT,
+            read=HTTP_READ_TIMEOUT,
+            write=HTTP_WRITE_TIMEOUT,
+            pool=HTTP_POOL_TIMEOUT,
+        )
+
+    def client(self) -> httpx.AsyncClient:
+        """The shared async client for raw HTTP calls made by tools and the Groq SDK."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                timeout=self._timeout(),
+                limits=httpx.Limits(
+                    max_connections=HTTP_POOL_SIZE,
+                    max_keepalive_connections=HTTP_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                ),
+            )
+        return self._client
+
+    def groq(self) -> AsyncGroq:
+        """A single Groq client riding on the shared connection pool."""
+        if self._groq is None:
+            self._groq = AsyncGroq(http_client=self.client())
+        return self._groq
+
+    def bot_request(self) -> HTTPXRequest:
+        """Request backend for the PTB application, pooled and HTTP/2 capable."""
+        return HTTPXRequest(
+            connection_pool_size=HTTP_POOL_SIZE,
+            connect_timeout=HTTP_CONNECT_TIMEOUT,
+            read_timeout=HTTP_READ_TIMEOUT,
+            write_timeout=HTTP_WRITE_TIMEOUT,
+            pool_timeout=HTTP_POOL_TIMEOUT,
+            http_version="2" if HTTP2_AVAILABLE else "1.1",
+        )
+
+    def bind_bot(self, bot):
+        """Registers the application's bot so tools send through it instead of building their own."""
+        self._bot = bot
+
+    @property
+    def bot(self):
+        if self._bot is None:
+            raise RuntimeError("The Telegram bot has not been bound yet.")
+        return self._bot
+
+    async def close(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._groq = None
+
+
+http_clients = HttpClients()
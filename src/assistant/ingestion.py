@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+from src.assistant.metrics import register_metrics
+
+# Set up the logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 1000))
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 8))
+
+
+def update_chat_key(update):
+    """
+    Returns the ordering key of an update. Updates without a chat are independent of each other.
+    """
+    chat = update.effective_chat
+    if chat is not None:
+        return chat.id
+    return ("update", update.update_id)
+
+
+class UpdateQueue:
+    """
+    Bounded in-process queue drained by a pool of workers.
+    Updates of the same chat are processed one at a time and in arrival order,
+    while different chats are processed in parallel.
+    """
+    def __init__(self, process_update, max_size=UPDATE_QUEUE_SIZE, workers=UPDATE_WORKERS):
+        self._process_update = process_update
+        self._max_size = max_size
+        self._worker_count = workers
+
+        # Pending updates per chat, and the chats ready to be picked by a worker
+        self._pending = {}
+        self._ready = asyncio.Queue()
+        self._scheduled = set()
+        self._size = 0
+        self._workers = []
+
+        self._accepted = 0
+        self._rejected = 0
+        self._processed = 0
+        self._failed = 0
+        self._busy_workers = 0
+        self._max_depth = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_processing = 0.0
+
+    def submit(self, update):
+        """
+        Enqueues an update without waiting for it to be processed.
+        Returns False when the queue is full and the update was rejected.
+        """
+        if self._size >= self._max_size:
+            self._rejected += 1
+            logger.warning(f"[WARNING] Update queue is full, rejecting update {update.update_id}")
+            return False
+
+        key = update_chat_key(update)
+        self._pending.setdefault(key, deque()).append((update, time.monotonic()))
+        self._size += 1
+        self._accepted += 1
+        self._max_depth = max(self._max_depth, self._size)
+
+        if key not in self._scheduled:
+            self._scheduled.add(key)
+            self._ready.put_nowait(key)
+        return True
+
+    async def _worker(self, index):
+        while True:
+            key = await self._ready.get()
+            update, enqueued_at = self._pending[key].popleft()
+            self._size -= 1
+
+            wait = time.monotonic() - enqueued_at
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+
+            self._busy_workers += 1
+            started_at = time.monotonic()
+            try:
+                await self._process_update(update)
+                self._processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._failed += 1
+                logger.error(f"[ERROR] Worker {index} failed to process update {update.update_id}: {e}")
+            finally:
+                self._busy_workers -= 1
+                self._total_processing += time.monotonic() - started_at
+
+                # Hand the chat back to the pool only if more of its updates are waiting
+                if self._pending.get(key):
+                    self._ready.put_nowait(key)
+                else:
+                    self._pending.pop(key, None)
+                    self._scheduled.discard(key)
+
+    def start(self):
+        if self._workers:
+            return
+        logger.info(f"[INFO] Starting {self._worker_count} update workers (queue size {self._max_size})")
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self._worker_count)]
+
+    async def stop(self, timeout=10.0):
+        """Gives in-flight and queued updates up to `timeout` seconds to finish, then cancels the workers."""
+        deadline = time.monotonic() + timeout
+        while (self._size or self._busy_workers) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def metrics(self):
+        completed = self._processed + self._failed
+        dequeued = self._accepted - self._size
+        return {
+            "depth": self._size,
+            "max_depth": self._max_depth,
+            "capacity": self._max_size,
+            "active_chats": len(self._scheduled),
+            "workers": self._worker_count,
+            "busy_workers": self._busy_workers,
+            "accepted": self._accepted,
+            "rejected": self._rejected,
+            "processed": self._processed,
+            "failed": self._failed,
+            "avg_wait_seconds": self._total_wait / dequeued if dequeued else 0.0,
+            "max_wait_seconds": self._max_wait,
+            "avg_processing_seconds": self._total_processing / completed if completed else 0.0,
+        }
+
+
+def create_update_queue(process_update):
+    queue = UpdateQueue(process_update)
+    register_metrics("update_queue", queue.metrics)
+    return queue
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import time
+
+from src.assistant.metrics import register_metrics
+from src.assistant.workflow import profile_agent, summarization_agent, MAINTENANCE_THRESHOLD, State
+
+# Set up the logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class MaintenanceScheduler:
+    """
+    Runs the profile update and the summarization of a thread after its reply has been sent.
+    Both steps run concurrently on the same checkpoint and their results are merged back into it.
+    The next turn of the thread waits for the job, so it always reads the merged checkpoint.
+    """
+    def __init__(self):
+        self._pending = {}
+
+        self._scheduled = 0
+        self._completed = 0
+        self._failed = 0
+        self._skipped = 0
+        self._total_seconds = 0.0
+
+    def schedule(self, graph, config):
+        thread_id = config["configurable"]["thread_id"]
+        previous = self._pending.get(thread_id)
+        task = asyncio.create_task(self._run(graph, config, previous))
+        self._pending[thread_id] = task
+        task.add_done_callback(lambda done: self._forget(thread_id, done))
+        self._scheduled += 1
+
+    def _forget(self, thread_id, task):
+        if self._pending.get(thread_id) is task:
+            del self._pending[thread_id]
+
+    async def wait(self, thread_id):
+        """Waits for the thread's pending maintenance job, if any."""
+        task = self._pending.get(thread_id)
+        if task is not None:
+            await asyncio.wait([task])
+
+    async def drain(self):
+        if self._pending:
+            await asyncio.wait(list(self._pending.values()))
+
+    async def _run(self, graph, config, previous):
+        if previous is not None:
+            await asyncio.wait([previous])
+
+        started_at = time.monotonic()
+        try:
+            snapshot = await graph.aget_state(config)
+            state = snapshot.values
+            if len(state.get("messages", [])) <= MAINTENANCE_THRESHOLD:
+                self._skipped += 1
+                return
+
+            logger.info(f"[INFO] Running deferred maintenance for thread {config['configurable']['thread_id']}")
+            profile_update, summary_update = await asyncio.gather(
+                profile_agent.ainvoke(state, config),
+                summarization_agent.ainvoke(state, config),
+            )
+
+            # Only keys of the graph state can be written back to the checkpoint
+            update = {
+                key: value for key, value in {**profile_update, **summary_update}.items()
+                if key in State.__annotations__
+            }
+            # Recorded as the summarization step, so the thread's next step is END as with the inline path
+            await graph.aupdate_state(config, update, as_node="summarization_agent")
+            self._completed += 1
+        except Exception as e:
+            self._failed += 1
+            logger.error(f"[ERROR] Deferred maintenance failed: {e}")
+        finally:
+            self._total_seconds += time.monotonic() - started_at
+
+    def metrics(self):
+        finished = self._completed + self._failed + self._skipped
+        return {
+            "pending": len(self._pending),
+            "scheduled": self._scheduled,
+            "completed": self._completed,
+            "failed": self._failed,
+            "skipped": self._skipped,
+            "avg_seconds": self._total_seconds / finished if finished else 0.0,
+        }
+
+
+maintenance_scheduler = MaintenanceScheduler()
+register_metrics("maintenance", maintenance_scheduler.metrics)
@@ -0,0 +1,26 @@
+import logging
+from typing import Callable, Dict, Any
+
+# Set up the logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Components register a callable returning a snapshot of their counters
+_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register_metrics(name: str, provider: Callable[[], Dict[str, Any]]):
+    """Registers a metrics provider exposed under `name` on the /metrics endpoint."""
+    _providers[name] = provider
+
+
+def collect_metrics():
+    """Collects a snapshot from every registered provider."""
+    snapshot = {}
+    for name, provider in _providers.items():
+        try:
+            snapshot[name] = provider()
+        except Exception as e:
+            logger.error(f"[ERROR] Failed to collect metrics for {name}: {e}")
+            snapshot[name] = {"error": str(e)}
+    return snapshot
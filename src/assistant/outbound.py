@@ -0,0 +1,273 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+from collections import defaultdict
+from enum import IntEnum
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TimedOut, NetworkError
+
+from src.assistant.metrics import register_metrics
+
+# Set up the logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Telegram allows about one message per second in a chat and 30 per second overall
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", 1.0))
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", 3))
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", 30))
+OUTBOUND_GLOBAL_BURST = float(os.getenv("OUTBOUND_GLOBAL_BURST", 30))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", 3))
+# Idle chat buckets are dropped after this many seconds
+OUTBOUND_BUCKET_TTL = 300
+
+
+class Priority(IntEnum):
+    """Lower values are sent first."""
+    REPLY = 0
+    NOTICE = 1
+    MEDIA = 2
+    COSMETIC = 3
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, now):
+        """Seconds until a token is available, 0 if one is available now."""
+        self.refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _Job:
+    __slots__ = ("priority", "chat_id", "call", "future", "enqueued_at", "deadline", "attempt")
+
+    def __init__(self, priority, chat_id, call, future, deadline):
+        self.priority = priority
+        self.chat_id = chat_id
+        self.call = call
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.deadline = deadline
+        self.attempt = 0
+
+
+class OutboundScheduler:
+    """
+    Central queue for every Bot API call that sends something to a chat.
+    Calls are released in priority order through a per-chat and a global token bucket.
+    429 responses pause the chat for `retry_after`, network errors are retried with jittered backoff.
+    """
+    def __init__(self, chat_rate=OUTBOUND_CHAT_RATE, chat_burst=OUTBOUND_CHAT_BURST,
+                 global_rate=OUTBOUND_GLOBAL_RATE, global_burst=OUTBOUND_GLOBAL_BURST,
+                 max_retries=OUTBOUND_MAX_RETRIES):
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats = {}
+        self._max_retries = max_retries
+        self._heap = []
+        self._sequence = itertools.count()
+        self._wakeup = None
+        self._task = None
+
+        self._sent = defaultdict(int)
+        self._latency_total = defaultdict(float)
+        self._latency_max = defaultdict(float)
+        self._throttled = 0
+        self._retries = 0
+        self._failed = 0
+        self._dropped = 0
+
+    def _bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self._chat_rate, self._chat_burst)
+        return bucket
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._dispatch())
+
+    def _push(self, job):
+        heapq.heappush(self._heap, (job.priority, next(self._sequence), job))
+        self._wakeup.set()
+
+    async def send(self, chat_id, call, priority=Priority.REPLY, max_wait=None):
+        """
+        Schedules `call` (a function returning a Bot API coroutine) for `chat_id` and returns its result.
+        Jobs still waiting after `max_wait` seconds are dropped and return None.
+        """
+        loop = asyncio.get_running_loop()
+        self._ensure_started()
+        future = loop.create_future()
+        deadline = time.monotonic() + max_wait if max_wait is not None else None
+        self._push(_Job(priority, chat_id, call, future, deadline))
+        return await future
+
+    def _next_job(self, now):
+        """Pops the most urgent job that may be sent now, or returns the time to wait for one."""
+        global_wait = self._global.wait_time(now)
+        if global_wait > 0:
+            return None, global_wait
+
+        # Jobs come off the heap in priority order; those of chats that must wait are put back afterwards
+        skipped, chat_waits = [], {}
+        job, shortest_wait = None, None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            candidate = entry[2]
+            if candidate.future.done() or (candidate.deadline is not None and now > candidate.deadline):
+                # Left for _prune, which resolves expired jobs
+                skipped.append(entry)
+                continue
+            if candidate.chat_id not in chat_waits:
+                chat_waits[candidate.chat_id] = self._bucket(candidate.chat_id).wait_time(now)
+            wait = chat_waits[candidate.chat_id]
+            if wait == 0:
+                job = candidate
+                break
+            skipped.append(entry)
+            shortest_wait = wait if shortest_wait is None else min(shortest_wait, wait)
+
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+        return job, None if job is not None else shortest_wait
+
+    def _prune(self, now):
+        kept = []
+        for entry in self._heap:
+            job = entry[2]
+            if job.future.done():
+                continue
+            if job.deadline is not None and now > job.deadline:
+                self._dropped += 1
+                job.future.set_result(None)
+                continue
+            kept.append(entry)
+        if len(kept) != len(self._heap):
+            self._heap = kept
+            heapq.heapify(self._heap)
+
+        for chat_id, bucket in list(self._chats.items()):
+            if now - bucket.updated_at > OUTBOUND_BUCKET_TTL and now > bucket.blocked_until:
+                del self._chats[chat_id]
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            self._prune(now)
+
+            job, wait = self._next_job(now) if self._heap else (None, None)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._global.tokens -= 1
+            self._bucket(job.chat_id).tokens -= 1
+            asyncio.create_task(self._execute(job))
+
+    async def _execute(self, job):
+        try:
+            result = await job.call()
+        except RetryAfter as e:
+            self._throttled += 1
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+            logger.warning(f"[WARNING] Telegram throttled chat {job.chat_id}, retrying in {retry_after}s")
+            self._bucket(job.chat_id).blocked_until = time.monotonic() + float(retry_after)
+            self._push(job)
+            return
+        except (BadRequest, Forbidden) as e:
+            # Permanent errors (BadRequest subclasses NetworkError), let the caller fall back right away
+            self._failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+        except (TimedOut, NetworkError) as e:
+            job.attempt += 1
+            if job.attempt > self._max_retries:
+                self._failed += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+                return
+            self._retries += 1
+            delay = min(2 ** job.attempt, 30) * (0.5 + random.random())
+            logger.warning(f"[WARNING] Send to chat {job.chat_id} failed ({e}), retry {job.attempt} in {delay:.1f}s")
+            asyncio.get_running_loop().call_later(delay, self._push, job)
+            return
+        except Exception as e:
+            self._failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+
+        latency = time.monotonic() - job.enqueued_at
+        name = job.priority.name.lower()
+        self._sent[name] += 1
+        self._latency_total[name] += latency
+        self._latency_max[name] = max(self._latency_max[name], latency)
+        if not job.future.done():
+            job.future.set_result(result)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def metrics(self):
+        return {
+            "queued": len(self._heap),
+            "chats": len(self._chats),
+            "throttled": self._throttled,
+            "retries": self._retries,
+            "failed": self._failed,
+            "dropped": self._dropped,
+            "sent": dict(self._sent),
+            "avg_latency_seconds": {
+                name: self._latency_total[name] / count for name, count in self._sent.items() if count
+            },
+            "max_latency_seconds": dict(self._latency_max),
+        }
+
+
+outbound = OutboundScheduler()
+register_metrics("outbound", outbound.metrics)
+
+
+async def reply_text(update, text, priority=Priority.REPLY, max_wait=None, **kwargs):
+    """Replies in the update's chat through the outbound scheduler."""
+    return await outbound.send(
+        update.effective_chat.id, lambda: update.message.reply_text(text, **kwargs), priority, max_wait
+    )
+
+
+async def edit_text(message, text, priority=Priority.REPLY, **kwargs):
+    """Edits a sent message through the outbound scheduler."""
+    return await outbound.send(message.chat_id, lambda: message.edit_text(text, **kwargs), priority)
+
+
+async def delete_message(message, priority=Priority.COSMETIC):
+    return await outbound.send(message.chat_id, lambda: message.delete(), priority)
@@ -0,0 +1,87 @@
+import logging
+import os
+import time
+
+from telegram.error import BadRequest
+
+from src.assistant.outbound import Priority, reply_text, edit_text
+
+# Set up the logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Stream replies token by token instead of sending them once complete
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "true").lower() == "true"
+# Telegram rate-limits edits of one message to roughly one per second
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", 1.0))
+TELEGRAM_MESSAGE_LIMIT = 4096
+PLACEHOLDER = "…"
+
+
+def _not_modified(error):
+    return isinstance(error, BadRequest) and "not modified" in str(error).lower()
+
+
+class TelegramMessageStream:
+    """
+    Shows a reply while it is being generated: a placeholder is sent with the first tokens
+    and edited as more arrive, at most once per `edit_interval` seconds.
+    The final edit applies Markdown, falling back to plain text if Telegram rejects it.
+    """
+    def __init__(self, update, edit_interval=STREAM_EDIT_INTERVAL):
+        self._update = update
+        self._edit_interval = edit_interval
+        self._message = None
+        self._text = ""
+        self._shown = ""
+        self._last_edit = 0.0
+
+    @property
+    def started(self):
+        return self._message is not None
+
+    async def append(self, token: str):
+        self._text += token
+        if not self._text.strip():
+            return
+
+        now = time.monotonic()
+        if self._message is None:
+            self._shown = self._text[:TELEGRAM_MESSAGE_LIMIT]
+            self._message = await reply_text(self._update, self._shown or PLACEHOLDER)
+            self._last_edit = now
+        elif now - self._last_edit >= self._edit_interval:
+            # Intermediate edits yield to other chats' replies
+            await self._edit(self._text[:TELEGRAM_MESSAGE_LIMIT], priority=Priority.NOTICE)
+            self._last_edit = now
+
+    async def _edit(self, text, parse_mode=None, priority=Priority.REPLY):
+        if text == self._shown and parse_mode is None:
+            return
+        try:
+            if await edit_text(self._message, text, priority, parse_mode=parse_mode) is not None:
+                self._shown = text
+        except Exception as e:
+            if not _not_modified(e):
+                raise
+
+    async def finish(self, text: str = None):
+        """Replaces the streamed text with the final reply, formatted as Markdown."""
+        text = text if text is not None else self._text
+        chunks = [text[i:i + TELEGRAM_MESSAGE_LIMIT] for i in range(0, len(text), TELEGRAM_MESSAGE_LIMIT)] or [""]
+
+        if self._message is None:
+            self._message = await reply_text(self._update, PLACEHOLDER)
+        try:
+            await self._edit(chunks[0], parse_mode="markdown")
+        except Exception as e:
+            logger.error(f"[SKIP THIS ERROR]]Error sending message: {e}")
+            await self._edit(chunks[0])
+
+        # Replies longer than one Telegram message continue in new messages
+        for chunk in chunks[1:]:
+            try:
+                await reply_text(self._update, chunk, parse_mode="markdown")
+            except Exception as e:
+                logger.error(f"[SKIP THIS ERROR]]Error sending message: {e}")
+                await reply_text(self._update, chunk)
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import os
+import re
+import shutil
+import time
+from dotenv import load_dotenv
+
+from src.assistant.http_client import http_clients
+from src.assistant.metrics import register_metrics
+
+load_dotenv()
+
+# Set up the logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+GROQ_STT_MODEL_NAME = os.environ.get("GROQ_STT_MODEL_NAME")
+# Voice notes longer than this (seconds) are split on silence and the parts transcribed in parallel
+VOICE_CHUNK_SECONDS = float(os.getenv("VOICE_CHUNK_SECONDS", 60))
+# Parts of one voice note transcribed at the same time
+VOICE_MAX_PARALLEL = int(os.getenv("VOICE_MAX_PARALLEL", 4))
+VOICE_SILENCE_DB = os.getenv("VOICE_SILENCE_DB", "-30dB")
+VOICE_SILENCE_SECONDS = float(os.getenv("VOICE_SILENCE_SECONDS", 0.4))
+
+FFMPEG = shutil.which("ffmpeg")
+SILENCE_PATTERN = re.compile(r"silence_(start|end): (-?[\d.]+)")
+
+_stats = {"voice_notes": 0, "chunked": 0, "chunks": 0, "errors": 0, "total_seconds": 0.0}
+register_metrics("transcription", lambda: dict(_stats))
+
+
+async def transcribe_audio(audio: bytes, filename: str = "voice.ogg"):
+    """Transcribe an in-memory audio file using the shared Groq client."""
+    transcription = await http_clients.groq().audio.transcriptions.create(
+        file=(filename, audio),
+        model=GROQ_STT_MODEL_NAME,
+        response_format="json",
+        temperature=0.0,
+        language="en"
+    )
+    return transcription.text
+
+
+async def run_ffmpeg(audio: bytes, *args):
+    """Pipes `audio` through ffmpeg and returns (stdout, stderr); nothing touches the disk."""
+    process = await asyncio.create_subprocess_exec(
+        FFMPEG, "-hide_banner", "-i", "pipe:0", *args,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate(audio)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with {process.returncode}: {stderr.decode(errors='ignore')[-300:]}")
+    return stdout, stderr
+
+
+async def detect_silences(audio: bytes):
+    """Returns the (start, end) seconds of every pause in the audio."""
+    _, stderr = await run_ffmpeg(
+        audio, "-af", f"silencedetect=noise={VOICE_SILENCE_DB}:d={VOICE_SILENCE_SECONDS}", "-f", "null", "-"
+    )
+    silences, start = [], None
+    for kind, seconds in SILENCE_PATTERN.findall(stderr.decode(errors="ignore")):
+        if kind == "start":
+            start = max(float(seconds), 0.0)
+        elif start is not None:
+            silences.append((start, float(seconds)))
+            start = None
+    return silences
+
+
+def plan_chunks(duration: float, silences, target: float = VOICE_CHUNK_SECONDS):
+    """
+    Splits [0, duration] into parts of at most `target` seconds, cutting in the middle of the last pause
+    before each limit so words aren't cut in half. Falls back to a hard cut when a part has no pause.
+    """
+    pauses = [(start + end) / 2 for start, end in silences]
+    cuts, position = [], 0.0
+    while duration - position > target:
+        limit = position + target
+        # Don't cut in the first half of a part, that would only produce many short parts
+        candidates = [pause for pause in pauses if position + target / 2 <= pause <= limit]
+        position = candidates[-1] if candidates else limit
+        cuts.append(position)
+    bounds = [0.0, *cuts, duration]
+    return list(zip(bounds, bounds[1:]))
+
+
+async def extract_chunk(audio: bytes, start: float, end: float):
+    # Re-encoding keeps the cut sample accurate; mono opus is what voice notes use anyway
+    stdout, _ = await run_ffmpeg(
+        audio, "-ss", f"{start:.2f}", "-to", f"{end:.2f}", "-ac", "1", "-c:a", "libopus", "-b:a", "32k",
+        "-f", "ogg", "pipe:1",
+    )
+    return stdout
+
+
+async def transcribe_voice(audio: bytes, duration=None):
+    """
+    Transcribes a voice note held in memory. Long notes are split on silence, the parts transcribed
+    concurrently and the text stitched back together in order.
+    """
+    _stats["voice_notes"] += 1
+    started_at = time.monotonic()
+    try:
+        if not FFMPEG or not duration or duration <= VOICE_CHUNK_SECONDS:
+            return await transcribe_audio(audio)
+
+        try:
+            chunks = plan_chunks(duration, await detect_silences(audio))
+        except Exception as e:
+            logger.warning(f"Couldn't split the voice note, transcribing it whole: {e}")
+            return await transcribe_audio(audio)
+
+        semaphore = asyncio.Semaphore(VOICE_MAX_PARALLEL)
+
+        async def transcribe_chunk(index, start, end):
+            async with semaphore:
+                return await transcribe_audio(await extract_chunk(audio, start, end), f"voice-{index}.ogg")
+
+        tasks = [asyncio.ensure_future(transcribe_chunk(index, *chunk)) for index, chunk in enumerate(chunks)]
+        try:
+            texts = await asyncio.gather(*tasks)
+        except Exception as e:
+            # A failed part, cut or transcription, spoils the stitched text; stop the others and start over
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            logger.warning(f"Couldn't transcribe the voice note in parts, transcribing it whole: {e}")
+            return await transcribe_audio(audio)
+        _stats["chunked"] += 1
+        _stats["chunks"] += len(chunks)
+        return " ".join(text.strip() for text in texts if text.strip())
+    except Exception:
+        _stats["errors"] += 1
+        raise
+    finally:
+        _stats["total_seconds"] += time.monotonic() - started_at
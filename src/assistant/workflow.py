@@ -1,13 +1,17 @@
-from langgraph.checkpoint.mongodb import MongoDBSaver
-from langgraph.prebuilt import ToolNode
-from pymongo import MongoClient
+from langchain_core.runnables import RunnableLambda
 from src.agents.langgraph_agent import MemoryAgent, SummarizationAgent, ConversationAgent, ProfileAgent
+from src.agents.tool_executor import create_tool_executor
 from src.agents.utils import tools
+from src.assistant.checkpointer import create_checkpointer, create_mongodb_client
 from src.assistant.state import State
 from langgraph.graph import StateGraph, START, END
 import os
 
-MONGODB_URI = os.environ.get("MONGODB_URI")
+# Above this many messages the profile is updated and the conversation summarized. A turn adds a user and an
+# assistant message (plus any tool calls), so the default keeps the cadence at about five turns
+MAINTENANCE_THRESHOLD = int(os.getenv("MAINTENANCE_THRESHOLD", 10))
+# Run the profile update and summarization as a background job after the reply instead of inside the graph
+DEFERRED_MAINTENANCE = os.getenv("DEFERRED_MAINTENANCE", "true").lower() == "true"
 
 def should_continue(state: State):
     last_message = state["messages"][-1]
@@ -16,7 +20,7 @@ def should_continue(state: State):
     if last_message.tool_calls:
         return "tool_agent"
 
-    elif total_messages > 15:
+    elif total_messages > MAINTENANCE_THRESHOLD and not DEFERRED_MAINTENANCE:
         return "profile_agent"
 
     return END
@@ -27,6 +31,11 @@ def tool_agent_callback(result):
     return workflow.add_node("conversation_agent", result)
 
 
+def agent_node(agent):
+    # Expose both the blocking and the async implementation so the graph works with stream() and astream()
+    return RunnableLambda(agent.invoke, afunc=agent.ainvoke)
+
+
 # --- Workflow Definition ---
 workflow = StateGraph(State)
 
@@ -35,14 +44,15 @@ memory_agent = MemoryAgent()
 summarization_agent = SummarizationAgent()
 conversation_agent = ConversationAgent()
 profile_agent = ProfileAgent()
-tool_agent = ToolNode(tools=tools)
+# Tool calls of one turn run concurrently, each bounded by its own timeout
+tool_agent = create_tool_executor(tools)
 
 # Add nodes
-workflow.add_node("memory_agent", memory_agent.invoke)
-workflow.add_node("summarization_agent", summarization_agent.invoke)
-workflow.add_node("conversation_agent", conversation_agent.invoke)
-workflow.add_node("tool_agent", tool_agent)
-workflow.add_node("profile_agent", profile_agent.invoke)
+workflow.add_node("memory_agent", agent_node(memory_agent))
+workflow.add_node("summarization_agent", agent_node(summarization_agent))
+workflow.add_node("conversation_agent", agent_node(conversation_agent))
+workflow.add_node("tool_agent", agent_node(tool_agent))
+workflow.add_node("profile_agent", agent_node(profile_agent))
 
 # Add edges
 workflow.add_edge(START, "memory_agent")
@@ -52,10 +62,28 @@ workflow.add_edge("tool_agent", "conversation_agent")
 workflow.add_edge("profile_agent", "summarization_agent")
 workflow.add_edge("summarization_agent", END)
 
-mongodb_client = MongoClient(MONGODB_URI)
-checkpointer = MongoDBSaver(mongodb_client)
-# checkpointer = MemorySaver()
+# The async checkpointer binds to the running event loop, so the graph is compiled on startup
+mongodb_client = None
+checkpointer = None
+graph = None
+
+
+async def setup_graph():
+    """
+    Compiles the workflow against the async MongoDB checkpointer and starts its pruning job.
+    Must be awaited from the application's event loop before any update is processed.
+    """
+    global mongodb_client, checkpointer, graph
+    if graph is None:
+        mongodb_client = create_mongodb_client()
+        checkpointer = await create_checkpointer(mongodb_client)
+        graph = workflow.compile(
+            checkpointer=checkpointer,
+        )
+    return graph
+
 
-graph = workflow.compile(
-    checkpointer=checkpointer,
-)
\ No newline at end of file
+def get_graph():
+    if graph is None:
+        raise RuntimeError("Graph is not initialized. Await setup_graph() on startup first.")
+    return graph
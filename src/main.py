@@ -4,6 +4,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 import uvicorn
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
 import logging
@@ -24,11 +25,34 @@ if not TOKEN:
 # Initialize FastAPI app
 app = FastAPI()
 
-# Set up the bot
-application = Application.builder().token(TOKEN).build()
+from src.assistant.http_client import http_clients
+
+# Set up the bot. Per-chat ordering and the concurrency cap are enforced by the update queue,
+# so PTB must not serialize process_update() calls on its own
+application = (
+    Application.builder().token(TOKEN).request(http_clients.bot_request()).concurrent_updates(True).build()
+)
+# Tools send through this bot and its connection pool
+http_clients.bind_bot(application.bot)
 
 # Import and add handlers
 from src.assistant.handlers import start, handle_message, handle_voice_message, handle_sticker
+from src.assistant import workflow
+from src.assistant.dedup import create_update_deduplicator
+from src.assistant.ingestion import create_update_queue
+from src.assistant.metrics import collect_metrics
+from src.agents.utils import memory_writer, memory_compactor
+from src.memory.profile_store import profile_store
+from src.assistant.maintenance import maintenance_scheduler
+from src.assistant.outbound import outbound
+from src.tools.sticker_catalog import sticker_catalog
+from src.tools.telethon_session import telethon_session
+from src.tools.youtube_video_downloader import video_downloader
+
+# Updates are acknowledged immediately and processed by a pool of workers
+update_queue = create_update_queue(application.process_update)
+# Redelivered updates are dropped before they reach the queue; created on startup with the MongoDB client
+update_deduplicator = None
 
 application.add_handler(CommandHandler("start", start))
 application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
@@ -39,9 +63,39 @@ application.add_handler(MessageHandler(filters.Sticker.ALL, handle_sticker))
 async def on_startup():
     logger.info("Initializing Telegram application..")
     await application.initialize()
+    logger.info("Compiling LangGraph workflow..")
+    await workflow.setup_graph()
+    global update_deduplicator
+    update_deduplicator = create_update_deduplicator(workflow.mongodb_client)
+    await profile_store.start(workflow.mongodb_client)
+    await sticker_catalog.start()
+    await telethon_session.start()
+    memory_writer.start()
+    memory_compactor.start()
+    update_queue.start()
+
+async def on_shutdown():
+    logger.info("Draining update queue..")
+    await update_queue.stop()
+    logger.info("Finishing deferred maintenance..")
+    await maintenance_scheduler.drain()
+    logger.info("Flushing pending memories..")
+    await memory_writer.stop()
+    await memory_compactor.stop()
+    logger.info("Flushing dirty profiles..")
+    await profile_store.stop()
+    await sticker_catalog.stop()
+    await telethon_session.stop()
+    await video_downloader.stop()
+    if workflow.checkpointer is not None:
+        await workflow.checkpointer.stop()
+    await outbound.stop()
+    await application.shutdown()
+    await http_clients.close()
 
-# Add the startup event handler
+# Add the startup and shutdown event handlers
 app.add_event_handler("startup", on_startup)
+app.add_event_handler("shutdown", on_shutdown)
 
 # Define webhook endpoint
 @app.post("/webhook")
@@ -54,13 +108,25 @@ async def webhook(request: Request):
         # Log the update for debugging
         logger.info(f"Received update: {data}")
 
-        # Process the update
-        await application.process_update(update)
+        # Telegram resends updates it considers undelivered, run each one only once
+        if await update_deduplicator.is_duplicate(update.update_id):
+            return {"status": "duplicate"}
+
+        # Queue the update and acknowledge right away so Telegram doesn't retry it
+        if not update_queue.submit(update):
+            # Telegram redelivers the update later when it doesn't get a 2xx
+            await update_deduplicator.forget(update.update_id)
+            return JSONResponse(status_code=503, content={"status": "busy"})
         return {"status": "ok"}
     except Exception as e:
         logger.error(f"Error processing webhook: {e}")
         return {"status": "error", "message": str(e)}
 
+# Expose queue and pipeline counters for sizing the worker pool
+@app.get("/metrics")
+async def metrics():
+    return collect_metrics()
+
 # Define a health check endpoint
 @app.get("/")
 async def home():
@@ -0,0 +1,361 @@
+import asyncio
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+from dotenv import load_dotenv
+
+from src.assistant.metrics import register_metrics
+from src.memory.long_term_memory import parse_timestamp, MEMORY_HALF_LIFE_DAYS, MEMORY_WEIGHT_RECENCY, \
+    MEMORY_WEIGHT_UTILITY
+
+load_dotenv()
+
+# Set up the logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MEMORY_TTL_DAYS = float(os.getenv("MEMORY_TTL_DAYS", 180))
+MEMORY_MIN_UTILITY = float(os.getenv("MEMORY_MIN_UTILITY", 0.05))
+MEMORY_MAX_PER_USER = int(os.getenv("MEMORY_MAX_PER_USER", 500))
+# Cosine similarity above which memories of one user are merged into a single entry
+MEMORY_MERGE_THRESHOLD = float(os.getenv("MEMORY_MERGE_THRESHOLD", 0.9))
+# Characters kept of the consolidated text of merged memories
+MEMORY_MERGE_MAX_CHARS = int(os.getenv("MEMORY_MERGE_MAX_CHARS", 2000))
+# Hours between scheduled compactions, 0 disables the background job
+MEMORY_COMPACTION_INTERVAL = float(os.getenv("MEMORY_COMPACTION_INTERVAL", 24))
+MEMORY_COMPACTION_PAGE_SIZE = 1000
+# Seconds VACUUM waits for the Chroma database to be free of writers
+MEMORY_VACUUM_TIMEOUT = int(os.getenv("MEMORY_VACUUM_TIMEOUT", 30))
+
+
+def directory_size(path):
+    """Total size in bytes of the files under `path` (the Chroma sqlite file and HNSW segments)."""
+    total = 0
+    for root, _, files in os.walk(path or "."):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _load_records(collection):
+    ids, documents, metadatas, embeddings = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(
+            include=["documents", "metadatas", "embeddings"], limit=MEMORY_COMPACTION_PAGE_SIZE, offset=offset
+        )
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        documents.extend(document or "" for document in page["documents"])
+        metadatas.extend(meta or {} for meta in page["metadatas"])
+        embeddings.extend(page["embeddings"])
+        offset += len(page["ids"])
+    return ids, documents, metadatas, embeddings
+
+
+def _retention_scores(timestamps, utility):
+    age_days = np.maximum(datetime.now().timestamp() - timestamps, 0) / 86400
+    recency = np.nan_to_num(np.exp(-np.log(2) * age_days / MEMORY_HALF_LIFE_DAYS), nan=0.0)
+    return MEMORY_WEIGHT_RECENCY * recency + MEMORY_WEIGHT_UTILITY * utility
+
+
+def _memory_units(indices, metadatas):
+    """
+    Groups records into the units compaction works on: a query and its response sharing a pair_id stay
+    together, records stored before pair ids existed are units of their own.
+    Returns {group key: [{type: record index}]}, grouped by user and, for unpaired records, by type.
+    """
+    pairs, groups = defaultdict(dict), defaultdict(list)
+    for i in indices:
+        meta = metadatas[i]
+        if meta.get("pair_id"):
+            pairs[(meta.get("user_id"), meta["pair_id"])][meta.get("type")] = i
+        else:
+            groups[(meta.get("user_id"), meta.get("type"))].append({meta.get("type"): i})
+    for (user_id, _), unit in pairs.items():
+        groups[(user_id, "pair")].append(unit)
+    return groups
+
+
+def _representative(unit):
+    # Pairs are compared by their queries, like the deduplication when they are stored
+    return unit.get("user_query", next(iter(unit.values())))
+
+
+def _consolidate(texts, limit):
+    """Joins the distinct texts of a cluster, best entry first, up to `limit` characters."""
+    consolidated = []
+    for text in texts:
+        text = text.strip()
+        if text and text not in consolidated:
+            consolidated.append(text)
+    return "\n".join(consolidated)[:limit]
+
+
+def _merge_clusters(units, vectors, documents, metadatas, scores, threshold):
+    """
+    Greedily clusters near-duplicate memory units of one group.
+    Every cluster is consolidated into its best-scoring unit: each of its records gets the distinct texts of the
+    records of the same type in the cluster, and the other units are deleted whole, so queries and responses
+    never lose their counterpart.
+    Returns the record indices to delete and the (document, metadata) updates of the kept records.
+    """
+    if len(units) < 2:
+        return [], {}
+
+    indices = np.array([_representative(unit) for unit in units])
+    group = vectors[indices]
+    norms = np.linalg.norm(group, axis=1, keepdims=True)
+    group = group / np.where(norms == 0, 1, norms)
+    similarity = group @ group.T
+
+    # Best entries become cluster representatives first
+    order = np.argsort(-scores[indices], kind="stable")
+    assigned = np.zeros(len(indices), dtype=bool)
+    removed, updates = [], {}
+    for position in order:
+        if assigned[position]:
+            continue
+        members = np.flatnonzero((similarity[position] >= threshold) & ~assigned)
+        assigned[members] = True
+        if len(members) < 2:
+            continue
+
+        # The keeper comes first so its text leads the consolidated document
+        members = [position, *(m for m in members if m != position)]
+        removed.extend(i for m in members[1:] for i in units[m].values())
+
+        for record_type, keeper in units[position].items():
+            same_type = [units[m][record_type] for m in members if record_type in units[m]]
+            member_meta = [metadatas[i] for i in same_type]
+            timestamps = [meta.get("timestamp") for meta in member_meta if meta.get("timestamp")]
+            updates[keeper] = (
+                _consolidate([documents[i] for i in same_type], MEMORY_MERGE_MAX_CHARS),
+                {
+                    **metadatas[keeper],
+                    "timestamp": max(timestamps, key=parse_timestamp) if timestamps
+                    else metadatas[keeper].get("timestamp"),
+                    "utility_score": max(meta.get("utility_score", 0) or 0 for meta in member_meta),
+                    "merged_count": sum(meta.get("merged_count", 1) for meta in member_meta),
+                },
+            )
+    return removed, updates
+
+
+def compact_collection(collection, ttl_days=MEMORY_TTL_DAYS, min_utility=MEMORY_MIN_UTILITY,
+                       max_per_user=MEMORY_MAX_PER_USER, merge_threshold=MEMORY_MERGE_THRESHOLD):
+    """
+    Expires, merges and caps the memories of a collection.
+    Returns the number of expired, merged and capped records.
+    """
+    ids, documents, metadatas, embeddings = _load_records(collection)
+    report = {"expired": 0, "merged": 0, "capped": 0}
+    if not ids:
+        return report
+
+    timestamps = np.array([parse_timestamp(meta.get("timestamp")) for meta in metadatas], dtype=np.float64)
+    utility = np.array([meta.get("utility_score", 0) or 0 for meta in metadatas], dtype=np.float32)
+    scores = _retention_scores(timestamps, utility)
+    vectors = np.asarray(embeddings, dtype=np.float32)
+
+    # 1. TTL and utility threshold; records without a timestamp are never expired by age
+    age_days = (datetime.now().timestamp() - timestamps) / 86400
+    expired = (np.nan_to_num(age_days, nan=0.0) > ttl_days) | (utility < min_utility)
+    # A pair expires as a whole, judged by its query
+    for unit in (unit for units in _memory_units(range(len(ids)), metadatas).values() for unit in units):
+        expired[list(unit.values())] = expired[_representative(unit)]
+    report["expired"] = int(expired.sum())
+    to_delete = {ids[i] for i in np.flatnonzero(expired)}
+
+    # 2. Near-duplicate clusters per user, of pairs or of unpaired records of one type
+    updates = {}
+    for units in _memory_units(np.flatnonzero(~expired), metadatas).values():
+        removed, kept = _merge_clusters(units, vectors, documents, metadatas, scores, merge_threshold)
+        report["merged"] += len(removed)
+        to_delete.update(ids[i] for i in removed)
+        updates.update(kept)
+
+    # 3. Per-user cap, dropping the stalest and least useful memories first, pairs as a whole
+    per_user = defaultdict(list)
+    remaining = [i for i, record_id in enumerate(ids) if record_id not in to_delete]
+    for (user_id, _), units in _memory_units(remaining, metadatas).items():
+        per_user[user_id].extend(units)
+    for units in per_user.values():
+        units.sort(key=lambda unit: -scores[_representative(unit)])
+        kept_records = 0
+        for unit in units:
+            kept_records += len(unit)
+            if kept_records > max_per_user:
+                report["capped"] += len(unit)
+                to_delete.update(ids[i] for i in unit.values())
+
+    # Kept records keep their own embedding, the merged ones were near-duplicates of it
+    updates = {i: update for i, update in updates.items() if ids[i] not in to_delete}
+    if updates:
+        collection.update(
+            ids=[ids[i] for i in updates],
+            embeddings=[vectors[i].tolist() for i in updates],
+            documents=[document for document, _ in updates.values()],
+            metadatas=[meta for _, meta in updates.values()],
+        )
+    to_delete = list(to_delete)
+    for start in range(0, len(to_delete), MEMORY_COMPACTION_PAGE_SIZE):
+        collection.delete(ids=to_delete[start:start + MEMORY_COMPACTION_PAGE_SIZE])
+
+    return report
+
+
+def vacuum_store(persist_dir, timeout=MEMORY_VACUUM_TIMEOUT):
+    """Rewrites chroma.sqlite3 without the pages freed by deleted records."""
+    path = os.path.join(persist_dir or ".", "chroma.sqlite3")
+    if not os.path.exists(path):
+        return
+    connection = sqlite3.connect(path, timeout=timeout)
+    try:
+        connection.execute("VACUUM")
+    except sqlite3.Error as e:
+        logger.warning(f"[WARNING] Couldn't vacuum {path}: {e}")
+    finally:
+        connection.close()
+
+
+def remove_orphaned_segments(persist_dir):
+    """Deletes the HNSW directories of dropped collections, which Chroma leaves on disk."""
+    path = os.path.join(persist_dir or ".", "chroma.sqlite3")
+    connection = sqlite3.connect(path)
+    try:
+        segments = {row[0] for row in connection.execute("SELECT id FROM segments")}
+    finally:
+        connection.close()
+    for entry in os.scandir(persist_dir or "."):
+        # Segment directories are named after the segment id
+        if entry.is_dir() and len(entry.name) == 36 and entry.name.count("-") == 4 and entry.name not in segments:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def rebuild_collection(client, collection, embedding_function):
+    """
+    Recreates a collection from its records, so its HNSW index files only hold live entries.
+    Records are staged in a new collection that takes over the name once the old one is dropped. Run it only
+    while nothing else writes to the store, records added meanwhile would be lost.
+    """
+    ids, documents, metadatas, embeddings = _load_records(collection)
+    name = collection.name
+    staging = client.create_collection(
+        name=f"rebuild-{name}"[:63], metadata=collection.metadata, embedding_function=embedding_function
+    )
+    for start in range(0, len(ids), MEMORY_COMPACTION_PAGE_SIZE):
+        end = start + MEMORY_COMPACTION_PAGE_SIZE
+        staging.add(
+            ids=ids[start:end],
+            documents=documents[start:end],
+            # Chroma rejects empty metadata dicts
+            metadatas=[meta or None for meta in metadatas[start:end]],
+            embeddings=[list(vector) for vector in embeddings[start:end]],
+        )
+    client.delete_collection(name)
+    staging.modify(name=name)
+    logger.info(f"[INFO] Rebuilt collection {name} with {len(ids)} records")
+
+
+def compact_memory(partitions, persist_dir):
+    """
+    Compacts every memory collection and reports record counts and store size before and after.
+
+    Deleted records free their pages in chroma.sqlite3, which is vacuumed afterwards, but HNSW deletes only
+    mark entries: the index files of a collection keep their size until it is rebuilt with rebuild_collection
+    (python -m src.memory.compaction --rebuild, with the bot stopped).
+    """
+    started_at = time.monotonic()
+    collections = partitions.all_collections()
+    report = {
+        "collections": len(collections),
+        "records_before": sum(c.count() for c in collections),
+        "bytes_before": directory_size(persist_dir),
+        "expired": 0,
+        "merged": 0,
+        "capped": 0,
+    }
+
+    for collection in collections:
+        try:
+            for key, value in compact_collection(collection).items():
+                report[key] += value
+        except Exception as e:
+            logger.error(f"[ERROR] Failed to compact collection {collection.name}: {e}")
+
+    report["records_after"] = sum(c.count() for c in collections)
+    if report["records_after"] < report["records_before"]:
+        vacuum_store(persist_dir)
+    report["bytes_after"] = directory_size(persist_dir)
+    report["seconds"] = time.monotonic() - started_at
+    logger.info(f"[INFO] Memory compaction finished: {report}")
+    return report
+
+
+class MemoryCompactor:
+    """Runs compact_memory periodically in a worker thread."""
+    def __init__(self, partitions, persist_dir, interval_hours=MEMORY_COMPACTION_INTERVAL):
+        self._partitions = partitions
+        self._persist_dir = persist_dir
+        self._interval = interval_hours * 3600
+        self._task = None
+        self.last_report = {}
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._interval)
+            try:
+                self.last_report = await asyncio.to_thread(compact_memory, self._partitions, self._persist_dir)
+            except Exception as e:
+                logger.error(f"[ERROR] Memory compaction failed: {e}")
+
+    def start(self):
+        if self._task is None and self._interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def metrics(self):
+        return {"interval_hours": self._interval / 3600, "last_report": self.last_report}
+
+
+def create_memory_compactor(partitions, persist_dir):
+    compactor = MemoryCompactor(partitions, persist_dir)
+    register_metrics("memory_compaction", compactor.metrics)
+    return compactor
+
+
+if __name__ == "__main__":
+    # Offline run: python -m src.memory.compaction [--rebuild]
+    import chromadb
+    from chromadb import Settings
+
+    from src.memory.embeddings import chroma_embedding_function
+    from src.memory.memory_partitions import MemoryPartitions
+
+    persist_dir = os.getenv("PERSIST_DIR")
+    client = chromadb.PersistentClient(path=persist_dir, settings=Settings(anonymized_telemetry=False))
+    partitions = MemoryPartitions(client, "assistant_memory", chroma_embedding_function)
+    compact_memory(partitions, persist_dir)
+    if "--rebuild" in sys.argv:
+        for memory_collection in partitions.all_collections():
+            rebuild_collection(client, memory_collection, chroma_embedding_function)
+        remove_orphaned_segments(persist_dir)
+        vacuum_store(persist_dir)
+        logger.info(f"[INFO] Memory store size after rebuild: {directory_size(persist_dir)} bytes")
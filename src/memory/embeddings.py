@@ -0,0 +1,141 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from src.assistant.metrics import register_metrics
+
+# Set up the logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/paraphrase-MiniLM-L6-v2")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 4096))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+
+
+class EmbeddingService:
+    """
+    Single embedding model shared by memory retrieval, memory storage and the Chroma collection.
+    Texts are encoded in batches and the resulting vectors are cached by content hash.
+    Vectors are L2-normalized, so cosine similarity is a plain dot product.
+    """
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, cache_size=EMBEDDING_CACHE_SIZE,
+                 batch_size=EMBEDDING_BATCH_SIZE):
+        self._model_name = model_name
+        self._cache_size = cache_size
+        self._batch_size = batch_size
+        self._model = None
+        self._cache = OrderedDict()
+        # Called from worker threads (asyncio.to_thread), guard the model and the cache
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._batches = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            logger.info(f"[INFO] Loading embedding model {self._model_name}")
+            self._model = SentenceTransformer(self._model_name)
+        return self._model
+
+    @staticmethod
+    def _key(text: str):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Returns a (len(texts), dim) array, encoding only the texts missing from the cache in one batch."""
+        with self._lock:
+            keys = [self._key(text) for text in texts]
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    self._hits += 1
+                elif key not in missing:
+                    missing[key] = text
+                    self._misses += 1
+                else:
+                    # Repeated within the same batch, encoded once
+                    self._hits += 1
+
+            if missing:
+                vectors = self.model.encode(
+                    list(missing.values()),
+                    batch_size=self._batch_size,
+                    normalize_embeddings=True,
+                    convert_to_numpy=True,
+                )
+                self._batches += 1
+                for key, vector in zip(missing, vectors):
+                    self._cache[key] = vector.astype(np.float32)
+                    self._cache.move_to_end(key)
+
+            result = np.stack([self._cache[key] for key in keys]) if keys else np.empty((0, 0), dtype=np.float32)
+
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+            return result
+
+    def embed_one(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
+
+    def metrics(self):
+        lookups = self._hits + self._misses
+        return {
+            "model": self._model_name,
+            "cached_vectors": len(self._cache),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+            "encode_batches": self._batches,
+        }
+
+
+def normalize_stored_embeddings(collection, page_size=EMBEDDING_BATCH_SIZE * 16):
+    """
+    One-time migration: L2-normalizes vectors stored before the service normalized its output.
+    A raw model vector scaled to unit length equals its normalized encoding, so nothing is re-encoded.
+    Records that are already unit length are left alone, which makes repeated runs cheap no-ops.
+    """
+    updated, offset = 0, 0
+    while True:
+        page = collection.get(include=["embeddings"], limit=page_size, offset=offset)
+        ids = page.get("ids") or []
+        if not ids:
+            break
+        vectors = np.asarray(page["embeddings"], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1)
+        stale = np.flatnonzero((np.abs(norms - 1.0) > 1e-3) & (norms > 0))
+        if stale.size:
+            collection.update(
+                ids=[ids[i] for i in stale],
+                embeddings=(vectors[stale] / norms[stale, None]).tolist(),
+            )
+            updated += int(stale.size)
+        offset += len(ids)
+    if updated:
+        logger.info(f"[INFO] Normalized {updated} stored embeddings in {collection.name}")
+    return updated
+
+
+class ChromaEmbeddingFunction:
+    """Adapts the shared EmbeddingService to Chroma's embedding function interface."""
+    def __init__(self, service: EmbeddingService):
+        self._service = service
+
+    def __call__(self, input):
+        return self._service.embed(list(input)).tolist()
+
+
+embedding_service = EmbeddingService()
+chroma_embedding_function = ChromaEmbeddingFunction(embedding_service)
+register_metrics("embeddings", embedding_service.metrics)
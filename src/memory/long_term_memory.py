@@ -1,18 +1,24 @@
 import traceback
 import uuid
 from datetime import datetime
+import os
 import numpy as np
-import torch
-from sentence_transformers import SentenceTransformer
-from torch.nn.functional import cosine_similarity
 import logging
 
+from src.memory.embeddings import embedding_service
+
 # Set up the logger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load model globally to avoid repeated initialization
-model = SentenceTransformer('sentence-transformers/paraphrase-MiniLM-L6-v2')
+# Cosine similarity above which a new memory counts as a duplicate of an existing one
+MEMORY_DEDUP_THRESHOLD = float(os.getenv("MEMORY_DEDUP_THRESHOLD", 0.5))
+
+# Re-ranking of retrieved memories: weights of similarity, recency and utility, and the recency half-life
+MEMORY_WEIGHT_SIMILARITY = float(os.getenv("MEMORY_WEIGHT_SIMILARITY", 0.6))
+MEMORY_WEIGHT_RECENCY = float(os.getenv("MEMORY_WEIGHT_RECENCY", 0.25))
+MEMORY_WEIGHT_UTILITY = float(os.getenv("MEMORY_WEIGHT_UTILITY", 0.15))
+MEMORY_HALF_LIFE_DAYS = float(os.getenv("MEMORY_HALF_LIFE_DAYS", 30))
 
 def get_embedding(text):
     """
@@ -24,7 +30,7 @@ def get_embedding(text):
             text = " ".join(text) if all(isinstance(i, str) for i in text) else text[0]
         if not isinstance(text, str):
             raise ValueError(f"Invalid text input: {text}")
-        return model.encode(text)
+        return embedding_service.embed_one(text)
     except Exception as e:
         logger.info(f"[ERROR] Failed to encode text: {text}, Error: {e}")
         return None
@@ -47,59 +53,154 @@ def is_valid_embedding(embedding):
     """
     return embedding is not None and isinstance(embedding, np.ndarray) and embedding.size > 0
 
-def store_memory(query, response, collection, keywords=None):
+def distance_to_similarity(distances, collection):
     """
-    Stores a query-response pair in memory with metadata, ensuring no duplicate or similar entries.
+    Converts Chroma distances to cosine similarities for normalized embeddings,
+    according to the distance function of the collection. Vectors stored before embeddings were normalized
+    are rescaled by normalize_stored_embeddings at startup, so every stored vector is unit length.
     """
-    if not collection:
-        logger.info(f"[ERROR] Collection is None. Cannot store memory.")
-        return
+    distances = np.asarray(distances, dtype=np.float32)
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    if space == "l2":
+        # Chroma reports the squared L2 distance, which is 2 - 2 * cos for unit vectors
+        return 1.0 - distances / 2.0
+    # "cosine" and "ip" both report 1 - cos
+    return 1.0 - distances
+
+def parse_timestamp(value):
+    """Returns the POSIX time of an ISO timestamp, or NaN if it is missing or malformed."""
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return np.nan
+
+def rank_memories(raw_memory, n_results, collection):
+    """
+    Re-ranks over-fetched query results by similarity, exponential time decay and utility score,
+    and returns the best `n_results` in the same layout as collection.query.
+    """
+    if not raw_memory or not raw_memory.get("documents") or not raw_memory["documents"][0]:
+        return raw_memory
+
+    documents = raw_memory["documents"][0]
+    metadatas = [meta or {} for meta in raw_memory.get("metadatas", [[]])[0]]
+    distances = raw_memory.get("distances", [[]])[0]
+
+    similarity = distance_to_similarity(distances, collection)
+    timestamps = np.array([parse_timestamp(meta.get("timestamp")) for meta in metadatas], dtype=np.float64)
+    utility = np.array([meta.get("utility_score", 0) or 0 for meta in metadatas], dtype=np.float32)
 
-    def validate_and_get_embedding(text):
-        embedding = get_embedding(text)
-        if not is_valid_embedding(embedding):
-            raise ValueError(f"Invalid embedding for text: {text}")
-        return embedding
+    # Memories without a usable timestamp get no recency credit
+    age_days = np.maximum(datetime.now().timestamp() - timestamps, 0) / 86400
+    recency = np.nan_to_num(np.exp(-np.log(2) * age_days / MEMORY_HALF_LIFE_DAYS), nan=0.0)
+
+    scores = (
+        MEMORY_WEIGHT_SIMILARITY * similarity
+        + MEMORY_WEIGHT_RECENCY * recency
+        + MEMORY_WEIGHT_UTILITY * utility
+    )
+    top = np.argsort(-scores, kind="stable")[:n_results]
 
-    def compute_similarity(embedding1, embedding2):
-        return cosine_similarity(
-            torch.tensor(embedding1).unsqueeze(0),
-            torch.tensor(embedding2).unsqueeze(0)
-        ).item()
+    return {
+        "documents": [[documents[i] for i in top]],
+        "metadatas": [[metadatas[i] for i in top]],
+        "distances": [[distances[i] for i in top]],
+        "scores": [[float(scores[i]) for i in top]],
+    }
 
-    def prepare_metadata(text, t_type):
+def prepare_memory_batch(items, collection, threshold=MEMORY_DEDUP_THRESHOLD, metadata=None, where=None):
+    """
+    Builds the records for several (query, response, keywords) items at once.
+    Items whose query is similar to a stored memory, or to an earlier item of the batch, are skipped.
+    `metadata` is added to every record and `where` restricts the similarity check to matching records.
+    Returns one record set per item, None for skipped ones.
+    """
+    def prepare_metadata(text, t_type, keywords, pair_id):
         return {
+            **(metadata or {}),
+            # Links a query to its response so compaction merges and drops them together
+            "pair_id": pair_id,
             "timestamp": datetime.now().isoformat(),
             "type": t_type,
             "utility_score": calculate_utility_score(text, keywords),
         }
 
-    try:
-        # Check for existing similar memories
-        existing_results = collection.query(query_texts=[query], n_results=1)
-        if existing_results.get('documents') and existing_results['documents'][0]:
-            stored_query = existing_results['documents'][0][0]
-            stored_query_embedding = validate_and_get_embedding(stored_query)
-            query_embedding = validate_and_get_embedding(query)
-
-            if compute_similarity(query_embedding, stored_query_embedding) >= 0.5:
-                logger.info(f"[INFO] Similar memory already exists. Skipping storage.")
-                return
-        else:
-            logger.info(f"[INFO] No similar memory found. Proceeding with storage.")
+    if not items:
+        return []
 
-        # Validate embeddings for query and response
-        query_embedding = validate_and_get_embedding(query)
-        response_embedding = validate_and_get_embedding(response)
+    # Encode every query and response in a single pass
+    embeddings = embedding_service.embed([text for query, response, _ in items for text in (query, response)])
+    query_embeddings, response_embeddings = embeddings[0::2], embeddings[1::2]
 
-        # Store data in the collection
-        collection.add(
-            documents=[query, response],
-            metadatas=[prepare_metadata(query, "user_query"), prepare_metadata(response, "yui_response")],
-            embeddings=[query_embedding.tolist(), response_embedding.tolist()],
-            ids=[str(uuid.uuid4()), str(uuid.uuid4())]
+    # Nearest stored memory for every query in one round-trip, using the distances Chroma already computes
+    stored_similarity = np.full(len(items), -np.inf, dtype=np.float32)
+    if collection.count():
+        existing_results = collection.query(
+            query_embeddings=query_embeddings.tolist(), n_results=1, where=where, include=["distances"]
         )
-        logger.info(f"[INFO] Memory stored successfully.")
+        for i, distances in enumerate(existing_results.get("distances") or []):
+            if distances:
+                stored_similarity[i] = distance_to_similarity(distances[0], collection)
+
+    # Pairwise similarity inside the batch, only earlier items count as the original
+    batch_similarity = np.triu(query_embeddings @ query_embeddings.T >= threshold, k=1)
+
+    keep = stored_similarity < threshold
+    records = []
+    for i, (query, response, keywords) in enumerate(items):
+        if keep[i] and batch_similarity[:i, i][keep[:i]].any():
+            keep[i] = False
+        if not keep[i]:
+            logger.info(f"[INFO] Similar memory already exists. Skipping storage.")
+            records.append(None)
+            continue
+
+        pair_id = str(uuid.uuid4())
+        records.append({
+            "documents": [query, response],
+            "metadatas": [prepare_metadata(query, "user_query", keywords, pair_id),
+                          prepare_metadata(response, "yui_response", keywords, pair_id)],
+            "embeddings": [query_embeddings[i].tolist(), response_embeddings[i].tolist()],
+            "ids": [str(uuid.uuid4()), str(uuid.uuid4())],
+        })
+
+    return records
+
+def prepare_memory_records(query, response, collection, keywords=None, metadata=None, where=None):
+    """
+    Builds the records for a query-response pair, or returns None if a similar memory already exists.
+    """
+    return prepare_memory_batch([(query, response, keywords)], collection, metadata=metadata, where=where)[0]
+
+def add_memory_records(collection, records):
+    """
+    Writes several prepared record sets with a single collection.add call.
+    """
+    records = [r for r in records if r]
+    if not records:
+        return 0
+
+    collection.add(
+        documents=[doc for r in records for doc in r["documents"]],
+        metadatas=[meta for r in records for meta in r["metadatas"]],
+        embeddings=[emb for r in records for emb in r["embeddings"]],
+        ids=[record_id for r in records for record_id in r["ids"]],
+    )
+    return sum(len(r["ids"]) for r in records)
+
+def store_memory(query, response, collection, keywords=None, metadata=None, where=None):
+    """
+    Stores a query-response pair in memory with metadata, ensuring no duplicate or similar entries.
+    """
+    if not collection:
+        logger.info(f"[ERROR] Collection is None. Cannot store memory.")
+        return
+
+    try:
+        # Store data in the collection
+        records = prepare_memory_records(query, response, collection, keywords, metadata=metadata, where=where)
+        if add_memory_records(collection, [records]):
+            logger.info(f"[INFO] Memory stored successfully.")
 
     except Exception as e:
         logger.info(f"[ERROR] Failed to store memory: {e}")
@@ -0,0 +1,64 @@
+import logging
+import os
+import threading
+
+# Set up the logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# "metadata" tags records with the user id and filters on it, "collection" keeps one collection per user
+MEMORY_PARTITIONING = os.getenv("MEMORY_PARTITIONING", "metadata")
+
+
+class MemoryPartitions:
+    """
+    Resolves where a user's memories live, so retrieval only ever searches that user's records.
+    Memories written without a user id stay in the shared base collection.
+    """
+    def __init__(self, client, base_name, embedding_function, mode=MEMORY_PARTITIONING):
+        if mode not in ("metadata", "collection"):
+            raise ValueError(f"Invalid memory partitioning mode: {mode}. Valid modes are metadata, collection.")
+        self._client = client
+        self._base_name = base_name
+        self._embedding_function = embedding_function
+        self.mode = mode
+        self.default_collection = client.get_or_create_collection(
+            name=base_name, embedding_function=embedding_function
+        )
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def collection_for(self, user_id=None):
+        if user_id is None or self.mode == "metadata":
+            return self.default_collection
+
+        return self._get_collection(f"{self._base_name}_{user_id}")
+
+    def _get_collection(self, name):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = self._client.get_or_create_collection(
+                    name=name, embedding_function=self._embedding_function
+                )
+            return self._collections[name]
+
+    def all_collections(self):
+        """Every memory collection: the shared one plus the per-user collections found in the store."""
+        collections = [self.default_collection]
+        for listed in self._client.list_collections():
+            name = getattr(listed, "name", listed)
+            if name.startswith(f"{self._base_name}_"):
+                collections.append(self._get_collection(name))
+        return collections
+
+    def where_for(self, user_id=None):
+        """Chroma `where` filter restricting a query to the user's records."""
+        if user_id is None or self.mode == "collection":
+            return None
+        return {"user_id": str(user_id)}
+
+    def metadata_for(self, user_id=None):
+        """Metadata every record of the user is tagged with, regardless of the mode."""
+        if user_id is None:
+            return {}
+        return {"user_id": str(user_id)}
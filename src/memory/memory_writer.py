@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+import time
+import traceback
+from collections import defaultdict
+
+from src.assistant.metrics import register_metrics
+from src.memory.long_term_memory import prepare_memory_batch, add_memory_records
+
+# Set up the logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MEMORY_FLUSH_INTERVAL = float(os.getenv("MEMORY_FLUSH_INTERVAL", 5.0))
+MEMORY_FLUSH_SIZE = int(os.getenv("MEMORY_FLUSH_SIZE", 32))
+MEMORY_QUEUE_SIZE = int(os.getenv("MEMORY_QUEUE_SIZE", 1000))
+
+# Queued by stop() to end the background loop
+_STOP = object()
+
+
+class MemoryWriter:
+    """
+    Write-behind persistence for long-term memories.
+    store requests are queued and written in batches, one collection.add per flush,
+    either every `flush_interval` seconds or once `flush_size` requests are waiting.
+    """
+    def __init__(self, partitions, flush_interval=MEMORY_FLUSH_INTERVAL, flush_size=MEMORY_FLUSH_SIZE,
+                 max_queue=MEMORY_QUEUE_SIZE):
+        self._partitions = partitions
+        self._flush_interval = flush_interval
+        self._flush_size = flush_size
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+
+        self._submitted = 0
+        self._dropped = 0
+        self._written = 0
+        self._skipped = 0
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._last_flush_seconds = 0.0
+
+    def submit(self, query, response, keywords=None, user_id=None):
+        """Queues a query-response pair for storage without waiting for the vector store."""
+        try:
+            self._queue.put_nowait((query, response, keywords, user_id))
+            self._submitted += 1
+        except asyncio.QueueFull:
+            self._dropped += 1
+            logger.warning("[WARNING] Memory write queue is full. Dropping memory.")
+
+    def _write_batch(self, batch):
+        # Similarity checks are per user, the writes are grouped per collection
+        by_user = defaultdict(list)
+        for query, response, keywords, user_id in batch:
+            by_user[user_id].append((query, response, keywords))
+
+        by_collection = {}
+        for user_id, items in by_user.items():
+            collection = self._partitions.collection_for(user_id)
+            records = prepare_memory_batch(
+                items,
+                collection,
+                metadata=self._partitions.metadata_for(user_id),
+                where=self._partitions.where_for(user_id),
+            )
+            self._skipped += sum(1 for r in records if r is None)
+            by_collection.setdefault(collection.name, (collection, []))[1].extend(records)
+
+        return sum(add_memory_records(collection, records) for collection, records in by_collection.values())
+
+    async def _flush(self, batch):
+        if not batch:
+            return
+        started_at = time.monotonic()
+        try:
+            self._written += await asyncio.to_thread(self._write_batch, batch)
+            self._flushes += 1
+            logger.info(f"[INFO] Flushed {len(batch)} memories.")
+        except Exception as e:
+            self._failed_flushes += 1
+            logger.info(f"[ERROR] Failed to store memory batch: {e}")
+            traceback.print_exc()
+        finally:
+            self._last_flush_seconds = time.monotonic() - started_at
+
+    def _drain(self, batch):
+        while len(batch) < self._flush_size and not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                batch.append(item)
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self._flush_interval
+            while len(batch) < self._flush_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops the background loop once its current batch is written, then writes whatever is still queued."""
+        if self._task is not None:
+            await self._queue.put(_STOP)
+            await self._task
+            self._task = None
+
+        while not self._queue.empty():
+            batch = []
+            self._drain(batch)
+            await self._flush(batch)
+
+    def metrics(self):
+        return {
+            "queued": self._queue.qsize(),
+            "submitted": self._submitted,
+            "dropped": self._dropped,
+            "written_records": self._written,
+            "skipped_similar": self._skipped,
+            "flushes": self._flushes,
+            "failed_flushes": self._failed_flushes,
+            "last_flush_seconds": self._last_flush_seconds,
+        }
+
+
+def create_memory_writer(partitions):
+    writer = MemoryWriter(partitions)
+    register_metrics("memory_writer", writer.metrics)
+    return writer
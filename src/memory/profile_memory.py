@@ -1,23 +1,44 @@
+import copy
 import json
+import os
+import re
 from langchain_core.messages import HumanMessage, AIMessage
 from src.agents.utils import llm, llm_for_check
+from src.assistant.metrics import register_metrics
 import logging
-from typing import Dict
+from typing import Dict, List
 
 # Set up the logger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# "incremental" pre-filters new user messages and asks only for a JSON patch, "full" rewrites the whole profile
+PROFILE_UPDATE_MODE = os.getenv("PROFILE_UPDATE_MODE", "incremental")
 
-def update_profile(profile: Dict, conversation):
+# Phrases people use when they tell something about themselves
+PROFILE_FACT_PATTERNS = re.compile(
+    r"\b("
+    r"my name|call me|i was born|years old|birthday|(i'm|i am) \d+"
+    r"|i live|i'm from|i am from|i moved|my (home|city|country|hometown)"
+    r"|i work|i study|my (job|work|school|university|major|boss|company)"
+    r"|i (really )?(like|love|enjoy|hate|prefer|dislike|can't stand)|my favou?rite"
+    r"|i have|i've got|my (wife|husband|girlfriend|boyfriend|partner|kid|son|daughter|dog|cat|pet|family"
+    r"|mom|mother|dad|father|brother|sister|friend)"
+    r"|i speak|i'm learning|i am learning|my hobby|my hobbies|i play|i'm allergic|i am allergic"
+    r"|i don't (like|eat|drink)|i'm (a|an) |i am (a|an) "
+    r")\b",
+    re.IGNORECASE,
+)
+
+_extraction_stats = {"checked": 0, "skipped": 0, "llm_calls": 0, "patch_ops": 0, "invalid_ops": 0}
+register_metrics("profile_extraction", lambda: dict(_extraction_stats))
+
+
+def build_profile_prompt(profile: Dict, conversation):
     """
-    Update the user's profile based on recent conversation.
-    Handles malformed responses gracefully.
+    Builds the instruction prompt asking the worker LLM for an updated profile.
     """
-    if not isinstance(profile, dict):
-        profile = {}
-
-    prompt = (
+    return (
         "### User Profile Update Task ###\n\n"
         "#### Current User Profile ####\n"
         f"{json.dumps(profile, indent=2)}\n\n"
@@ -59,13 +80,18 @@ def update_profile(profile: Dict, conversation):
         "Return only the updated or original profile as valid JSON."
     )
 
+
+def parse_profile_response(profile: Dict, response: str):
+    """
+    Parses the LLM response into a profile dictionary.
+    Falls back to the original profile if the response is malformed.
+    """
     try:
-        response = llm_for_check.invoke([HumanMessage(content=prompt)]).content
         logger.debug(f"[DEBUG] Raw LLM Response: {response}")
 
         # Ensure the response is valid JSON
         response = response.strip()
-        print(f"[DEBUG]Updated Profile: {response}")
+        logger.debug(f"[DEBUG] Updated Profile: {response}")
         if not response.startswith("{") or not response.endswith("}"):
             raise ValueError("LLM response is not valid JSON.")
 
@@ -85,6 +111,201 @@ def update_profile(profile: Dict, conversation):
     return profile
 
 
+def update_profile(profile: Dict, conversation):
+    """
+    Update the user's profile based on recent conversation.
+    Handles malformed responses gracefully.
+    """
+    if not isinstance(profile, dict):
+        profile = {}
+
+    try:
+        prompt = build_profile_prompt(profile, conversation)
+        response = llm_for_check.invoke([HumanMessage(content=prompt)]).content
+    except Exception as e:
+        logger.error(f"Error updating profile: {e}")
+        return profile
+
+    return parse_profile_response(profile, response)
+
+
+async def aupdate_profile(profile: Dict, conversation):
+    """
+    Async variant of update_profile that awaits the worker LLM instead of blocking the event loop.
+    """
+    if not isinstance(profile, dict):
+        profile = {}
+
+    try:
+        prompt = build_profile_prompt(profile, conversation)
+        response = (await llm_for_check.ainvoke([HumanMessage(content=prompt)])).content
+    except Exception as e:
+        logger.error(f"Error updating profile: {e}")
+        return profile
+
+    return parse_profile_response(profile, response)
+
+
+def has_profile_facts(user_messages: List[str]):
+    """
+    Cheap local pre-filter: whether any of the messages may contain something worth keeping in the profile.
+    """
+    return any(PROFILE_FACT_PATTERNS.search(message or "") for message in user_messages)
+
+
+def new_user_messages(conversation, cursor=None):
+    """
+    Returns the contents of the user messages after the message with id `cursor`, and the id of the last one.
+    If the cursor is gone (trimmed by summarization), every remaining user message counts as new.
+    """
+    user_messages = [msg for msg in conversation if isinstance(msg, HumanMessage)]
+    ids = [msg.id for msg in user_messages]
+    if cursor in ids:
+        user_messages = user_messages[ids.index(cursor) + 1:]
+
+    new_cursor = user_messages[-1].id if user_messages else cursor
+    return [msg.content for msg in user_messages if isinstance(msg.content, str)], new_cursor
+
+
+def build_profile_patch_prompt(profile: Dict, user_messages: List[str]):
+    """
+    Builds a compact prompt asking only for the changes to the profile, as a JSON patch.
+    """
+    return (
+        "Update a user profile from new messages the user wrote.\n"
+        f"Profile: {json.dumps(profile, separators=(',', ':'), ensure_ascii=False)}\n"
+        f"Messages: {json.dumps(user_messages, ensure_ascii=False)}\n"
+        "Return ONLY a JSON array of RFC 6902 operations (op: add|replace|remove, path, value), "
+        "e.g. [{\"op\":\"replace\",\"path\":\"/name\",\"value\":\"Ann\"},"
+        "{\"op\":\"add\",\"path\":\"/interests/-\",\"value\":\"chess\"}]. "
+        "Use only explicit facts about the user, keep existing value types, "
+        "use a {city, country} object for location. Return [] if nothing changes."
+    )
+
+
+def parse_profile_patch(response: str):
+    """
+    Extracts the list of patch operations from the LLM response. Returns [] if it isn't valid.
+    """
+    response = response.strip()
+    start, end = response.find("["), response.rfind("]")
+    if start == -1 or end < start:
+        logger.error(f"Profile patch is not a JSON array. Response: {response}")
+        return []
+    try:
+        operations = json.loads(response[start:end + 1])
+    except json.JSONDecodeError as e:
+        logger.error(f"Error decoding profile patch: {e}. Response: {response}")
+        return []
+    return [op for op in operations if isinstance(op, dict)]
+
+
+def _resolve_parent(document, path):
+    tokens = [token.replace("~1", "/").replace("~0", "~") for token in path.lstrip("/").split("/")]
+    parent = document
+    for token in tokens[:-1]:
+        if isinstance(parent, list):
+            parent = parent[int(token)]
+        elif isinstance(parent, dict):
+            parent = parent.setdefault(token, {})
+        else:
+            raise ValueError(f"cannot descend into {type(parent).__name__} at {path}")
+    return parent, tokens[-1]
+
+
+def apply_profile_patch(profile: Dict, operations):
+    """
+    Applies add/replace/remove operations to a copy of the profile. Invalid operations are skipped.
+    """
+    patched = copy.deepcopy(profile)
+    for operation in operations:
+        try:
+            if not isinstance(operation, dict):
+                raise ValueError("operation is not an object")
+            op, path = operation.get("op"), operation.get("path", "")
+            if not isinstance(path, str):
+                raise ValueError(f"path must be a string, got {type(path).__name__}")
+            if op not in ("add", "replace", "remove") or not path.startswith("/") or path == "/":
+                raise ValueError(f"unsupported operation {op} {path}")
+
+            parent, key = _resolve_parent(patched, path)
+            if isinstance(parent, list):
+                if op == "remove":
+                    parent.pop(int(key))
+                elif key == "-":
+                    parent.append(operation["value"])
+                elif op == "add":
+                    if not 0 <= int(key) <= len(parent):
+                        raise IndexError(f"list index {key} out of range")
+                    parent.insert(int(key), operation["value"])
+                else:
+                    parent[int(key)] = operation["value"]
+            elif isinstance(parent, dict):
+                if op == "remove":
+                    parent.pop(key, None)
+                elif op == "add" and isinstance(parent.get(key), list) and not isinstance(operation["value"], list):
+                    # Models often "add" a single item to a list field
+                    if operation["value"] not in parent[key]:
+                        parent[key].append(operation["value"])
+                else:
+                    parent[key] = operation["value"]
+            else:
+                raise ValueError(f"cannot patch into {type(parent).__name__} at {path}")
+            _extraction_stats["patch_ops"] += 1
+        except (KeyError, IndexError, ValueError, TypeError) as e:
+            _extraction_stats["invalid_ops"] += 1
+            logger.warning(f"[WARNING] Skipping invalid profile patch operation {operation}: {e}")
+    return patched
+
+
+def _should_extract(user_messages: List[str]):
+    _extraction_stats["checked"] += 1
+    if not has_profile_facts(user_messages):
+        _extraction_stats["skipped"] += 1
+        logger.info("[INFO] No profile facts in new messages. Skipping profile extraction.")
+        return False
+    _extraction_stats["llm_calls"] += 1
+    return True
+
+
+def update_profile_incremental(profile: Dict, user_messages: List[str]):
+    """
+    Updates the profile from new user messages, calling the worker LLM only if they look profile-worthy.
+    """
+    if not isinstance(profile, dict):
+        profile = {}
+    if not _should_extract(user_messages):
+        return profile
+
+    try:
+        prompt = build_profile_patch_prompt(profile, user_messages)
+        response = llm_for_check.invoke([HumanMessage(content=prompt)]).content
+    except Exception as e:
+        logger.error(f"Error updating profile: {e}")
+        return profile
+
+    return apply_profile_patch(profile, parse_profile_patch(response))
+
+
+async def aupdate_profile_incremental(profile: Dict, user_messages: List[str]):
+    """
+    Async variant of update_profile_incremental.
+    """
+    if not isinstance(profile, dict):
+        profile = {}
+    if not _should_extract(user_messages):
+        return profile
+
+    try:
+        prompt = build_profile_patch_prompt(profile, user_messages)
+        response = (await llm_for_check.ainvoke([HumanMessage(content=prompt)])).content
+    except Exception as e:
+        logger.error(f"Error updating profile: {e}")
+        return profile
+
+    return apply_profile_patch(profile, parse_profile_patch(response))
+
+
 PROFILE_FILE = "profile.json"
 
 def load_profile():
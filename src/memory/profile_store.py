@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+
+from pymongo import UpdateOne
+
+from src.assistant.metrics import register_metrics
+from src.memory.profile_memory import load_profile
+
+# Set up the logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# "json" keeps one file per user in PROFILE_DIR, "mongodb" uses the MongoDB the checkpointer connects to
+PROFILE_BACKEND = os.getenv("PROFILE_BACKEND", "json")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_DB = os.getenv("PROFILE_DB", "checkpointing_db")
+PROFILE_COLLECTION = os.getenv("PROFILE_COLLECTION", "profiles")
+PROFILE_FLUSH_INTERVAL = float(os.getenv("PROFILE_FLUSH_INTERVAL", 2.0))
+# Profiles kept in memory; the least recently used clean ones are dropped and reloaded on demand
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 1000))
+# The legacy single-user profile.json belongs to the bot owner's chat
+CHAT_ID = os.getenv("CHAT_ID")
+
+
+class JsonDirectoryBackend:
+    """Stores every profile as <directory>/<user_id>.json, replaced atomically on write."""
+    def __init__(self, directory=PROFILE_DIR):
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, user_id):
+        return os.path.join(self._directory, f"{user_id}.json")
+
+    def _load(self, user_id):
+        try:
+            with open(self._path(user_id), "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def _save(self, user_id, profile):
+        # Write to a temporary file in the same directory and rename it over the old one
+        fd, tmp_path = tempfile.mkstemp(dir=self._directory, prefix=f".{user_id}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(profile, file, indent=2)
+            os.replace(tmp_path, self._path(user_id))
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    async def load(self, user_id):
+        return await asyncio.to_thread(self._load, user_id)
+
+    async def save_many(self, profiles):
+        def save_all():
+            for user_id, profile in profiles.items():
+                self._save(user_id, profile)
+        await asyncio.to_thread(save_all)
+
+
+class MongoProfileBackend:
+    """Stores profiles as documents keyed by user id."""
+    def __init__(self, collection):
+        self._collection = collection
+
+    async def load(self, user_id):
+        document = await self._collection.find_one({"_id": str(user_id)})
+        return document["profile"] if document else None
+
+    async def save_many(self, profiles):
+        await self._collection.bulk_write([
+            UpdateOne({"_id": str(user_id)}, {"$set": {"profile": profile}}, upsert=True)
+            for user_id, profile in profiles.items()
+        ])
+
+
+class ProfileStore:
+    """
+    Per-user profiles with a read-through LRU cache of `cache_size` profiles.
+    Updates only mark a profile dirty; dirty profiles are written together every `flush_interval` seconds
+    and on shutdown, so repeated updates of a profile are coalesced into one write. Dirty profiles are never
+    evicted before they are written.
+    """
+    def __init__(self, backend=None, flush_interval=PROFILE_FLUSH_INTERVAL, cache_size=PROFILE_CACHE_SIZE):
+        self._backend = backend
+        self._flush_interval = flush_interval
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+        self._dirty = set()
+        self._task = None
+
+        self._hits = 0
+        self._loads = 0
+        self._writes = 0
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._evictions = 0
+
+    def _create_backend(self, mongodb_client=None):
+        if PROFILE_BACKEND == "mongodb":
+            if mongodb_client is not None:
+                return MongoProfileBackend(mongodb_client[PROFILE_DB][PROFILE_COLLECTION])
+            logger.warning("[WARNING] PROFILE_BACKEND is mongodb but no client is available, using json")
+        return JsonDirectoryBackend()
+
+    async def start(self, mongodb_client=None):
+        if self._backend is None:
+            self._backend = self._create_backend(mongodb_client)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def _evict(self):
+        if len(self._cache) <= self._cache_size:
+            return
+        # Oldest first; dirty profiles stay until a flush has written them
+        for user_id in [user_id for user_id in self._cache if user_id not in self._dirty]:
+            if len(self._cache) <= self._cache_size:
+                break
+            del self._cache[user_id]
+            self._evictions += 1
+
+    def get_cached(self, user_id):
+        """Returns the cached profile without touching the backend, or None if it isn't loaded yet."""
+        return self._cache.get(user_id)
+
+    async def get(self, user_id):
+        if user_id in self._cache:
+            self._hits += 1
+            self._cache.move_to_end(user_id)
+            return self._cache[user_id]
+
+        self._loads += 1
+        profile = None
+        try:
+            profile = await self._backend.load(user_id)
+        except Exception as e:
+            logger.error(f"[ERROR] Failed to load profile of {user_id}: {e}")
+
+        if profile is None and CHAT_ID and str(user_id) == str(CHAT_ID):
+            # Carry over the profile saved before profiles were stored per user
+            try:
+                profile = await asyncio.to_thread(load_profile)
+            except FileNotFoundError:
+                profile = None
+        profile = profile if isinstance(profile, dict) else {}
+
+        # Another coroutine may have set the profile while this one was loading it
+        profile = self._cache.setdefault(user_id, profile)
+        self._evict()
+        return profile
+
+    def set(self, user_id, profile):
+        self._cache[user_id] = profile
+        self._cache.move_to_end(user_id)
+        self._dirty.add(user_id)
+        self._evict()
+
+    async def flush(self):
+        if not self._dirty or self._backend is None:
+            return
+        dirty, self._dirty = self._dirty, set()
+        profiles = {user_id: self._cache[user_id] for user_id in dirty}
+        try:
+            await self._backend.save_many(profiles)
+            self._writes += len(profiles)
+            self._flushes += 1
+            self._evict()
+        except Exception as e:
+            # Keep them dirty so the next flush retries
+            self._dirty |= dirty
+            self._failed_flushes += 1
+            logger.error(f"[ERROR] Error saving profiles: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            await self.flush()
+
+    def metrics(self):
+        return {
+            "backend": type(self._backend).__name__ if self._backend else None,
+            "cached": len(self._cache),
+            "dirty": len(self._dirty),
+            "evictions": self._evictions,
+            "cache_hits": self._hits,
+            "loads": self._loads,
+            "profiles_written": self._writes,
+            "flushes": self._flushes,
+            "failed_flushes": self._failed_flushes,
+        }
+
+
+profile_store = ProfileStore()
+register_metrics("profile_store", profile_store.metrics)
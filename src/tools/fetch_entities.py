@@ -1,97 +1,55 @@
-import asyncio
-import os
 from dotenv import load_dotenv
 from langchain_core.tools import tool
-from telethon import TelegramClient, errors, functions
 import logging
 
+from src.tools.telethon_session import telethon_session
+
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-API_ID = os.getenv("API_ID")
-API_HASH = os.getenv("API_HASH")
-client = TelegramClient("telethon_session", API_ID, API_HASH)
-
-async def fetch_telegram_entities(entity_type, count):
-    valid_types = {"user", "bot", "channel", "group", "chat", "all"}
-    if entity_type not in valid_types:
-        raise ValueError(f"Invalid entity type: {entity_type}. Valid types are {valid_types}.")
-
-    try:
-        await client.start()
-
-        if not client.is_connected():
-            raise ConnectionError("Client failed to connect.")
-
-        dialogs = await client.get_dialogs(limit=None)
-        print(f"Fetched {len(dialogs)} dialogs.")
+VALID_ENTITY_TYPES = {"user", "bot", "channel", "group", "chat", "all"}
+# Upper bound for one page, larger requests have to page with `offset`
+MAX_PAGE_SIZE = 50
 
-        formatted_entities = []
-        for dialog in dialogs:
-            entity = dialog.entity
-            entity_type_actual = None
+def query_telegram_entities(entity_type, count, offset=0):
+    """Answers from the session manager's in-memory index, no Telegram round trip per call."""
+    if entity_type not in VALID_ENTITY_TYPES:
+        raise ValueError(f"Invalid entity type: {entity_type}. Valid types are {VALID_ENTITY_TYPES}.")
+    if not telethon_session.ready:
+        raise ConnectionError("The Telegram dialog index isn't available yet.")
 
-            if hasattr(entity, "bot") and entity.bot:
-                entity_type_actual = "bot"
-            elif hasattr(entity, "megagroup") and not entity.megagroup:
-                entity_type_actual = "channel"
-            elif hasattr(entity, "megagroup") and entity.megagroup:
-                entity_type_actual = "group"
-            elif hasattr(entity, "title"):
-                entity_type_actual = "chat"
-            elif hasattr(entity, "first_name"):
-                entity_type_actual = "user"
-
-            if entity_type == "all" or entity_type == entity_type_actual:
-                formatted_entities.append({
-                    "id": entity.id,
-                    "username": getattr(entity, "username", None),
-                    "first_name": getattr(entity, "first_name", None),
-                    "last_name": getattr(entity, "last_name", None),
-                    "title": getattr(entity, "title", None),
-                    "type": entity_type_actual,
-                })
-
-        print(f"Filtered entities: {formatted_entities}")
-        return formatted_entities[:count]
-
-    except errors.UnauthorizedError:
-        print("Unauthorized access. Please check your API credentials.")
-        return ""
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        return ""
-    finally:
-        await client.disconnect()
+    count = max(1, min(int(count), MAX_PAGE_SIZE))
+    offset = max(0, int(offset))
+    entities, total = telethon_session.index.query(entity_type, count, offset)
+    next_offset = offset + len(entities)
+    return {
+        "entities": entities,
+        "total": total,
+        "next_offset": next_offset if next_offset < total else None,
+    }
 
 
 @tool
-def sync_fetch_telegram_entities(entity_type, count):
+async def fetch_telegram_entities(entity_type, count, offset=0):
     """
     A tool to fetch a list of Telegram entities based on type, use with caution
 
     Parameters:
         entity_type (str): Specifies the entity type ("user", "bot", "channel", "group", "chat", or "all").
-        count (int): The number of results to return.
+        count (int): The number of results to return (at most 50 per call).
+        offset (int): How many results to skip, pass the previous "next_offset" to get the next page.
 
     Returns:
-        list: A list of dictionaries with formatted entity data.
-
-    Raises:
-        ValueError: If an invalid entity type is provided.
-        Exception: For other unexpected errors.
+        dict: "entities" (a list of dictionaries with formatted entity data, most recently active first),
+              "total" (the number of entities of that type) and "next_offset" (None on the last page).
     """
     try:
-        result = asyncio.run(fetch_telegram_entities(entity_type, count))
-        if not result:
-            return ""
-
-        return result
+        return query_telegram_entities(entity_type, count, offset)
     except ValueError as ve:
-        print(f"Validation error: {ve}")
+        logger.error(f"Validation error: {ve}")
         return []
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        logger.error(f"An unexpected error occurred: {e}")
         return []
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from dotenv import load_dotenv
+
+from src.assistant.http_client import http_clients
+from src.assistant.metrics import register_metrics
+from src.tools.sticker_index import essential_emotions, emoji_emotions, sticker_index
+
+load_dotenv()
+
+# Set up the logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STICKER_SET_NAME = os.getenv("STICKER_SET_NAME")
+STICKER_CATALOG_PATH = os.getenv("STICKER_CATALOG_PATH", "sticker_set.json")
+# Sticker sets are re-fetched in the background once they are older than this (seconds)
+STICKER_SET_TTL = float(os.getenv("STICKER_SET_TTL", 24 * 3600))
+STICKER_REFRESH_INTERVAL = float(os.getenv("STICKER_REFRESH_INTERVAL", 3600))
+
+
+# Function to fetch the sticker set from Telegram (through the application's pooled bot)
+async def get_sticker_set(sticker_set_name):
+    sticker_set = await http_clients.bot.get_sticker_set(sticker_set_name)
+    return [sticker.to_dict() for sticker in sticker_set.stickers]
+
+# Categorize stickers based on their emoji
+def categorize_stickers_by_emotion(stickers):
+    emotion_dict = {emotion: [] for emotion in essential_emotions}
+
+    for sticker in stickers:
+        emoji = sticker.get("emoji")
+        for emotion in emoji_emotions.get(emoji, ()):
+            emotion_dict[emotion].append(sticker["file_id"])
+
+    return emotion_dict
+
+
+class StickerCatalog:
+    """
+    The single in-memory copy of every known sticker set, keyed by set name.
+
+    Each set is fetched once, re-fetched in the background when its TTL expires, and the catalog is
+    persisted atomically to `path`. The merged emotion -> stickers view feeds the sticker index.
+    """
+
+    def __init__(self, path=STICKER_CATALOG_PATH, ttl=STICKER_SET_TTL, refresh_interval=STICKER_REFRESH_INTERVAL):
+        self.path = path
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self._sets = {}
+        self._inflight = {}
+        self._failed = {}
+        self._task = None
+        self._stats = {"fetches": 0, "fetch_errors": 0, "saves": 0}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            logger.info("Sticker catalog not found, it will be fetched on startup")
+            return
+        except Exception as e:
+            logger.error(f"Failed to load the sticker catalog: {e}")
+            return
+
+        if isinstance(data.get("sets"), dict):
+            self._sets = data["sets"]
+        elif data and STICKER_SET_NAME:
+            # Older files hold only the default set's {emotion: [file_id]} map; refresh it on startup
+            self._sets = {STICKER_SET_NAME: {"fetched_at": 0, "stickers": data}}
+        elif data:
+            # Without STICKER_SET_NAME there is no set to fetch it from again, keep it as it is
+            self._sets = {"default": {"fetched_at": 0, "stickers": data, "refreshable": False}}
+        self._reindex()
+
+    def _write(self, snapshot):
+        # Write to a temporary file in the same directory and rename it over the old one
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".sticker_set.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(snapshot, file, indent=4)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    async def _save(self):
+        await asyncio.to_thread(self._write, {"sets": dict(self._sets)})
+        self._stats["saves"] += 1
+
+    def _reindex(self):
+        merged = {emotion: [] for emotion in essential_emotions}
+        for sticker_set in self._sets.values():
+            for emotion, stickers in sticker_set["stickers"].items():
+                merged.setdefault(emotion, []).extend(stickers)
+        sticker_index.rebuild(merged)
+
+    def knows(self, set_name):
+        return set_name in self._sets
+
+    async def _fetch(self, set_name):
+        try:
+            stickers = await get_sticker_set(set_name)
+            self._stats["fetches"] += 1
+        except Exception as e:
+            self._stats["fetch_errors"] += 1
+            self._failed[set_name] = time.time()
+            logger.error(f"Failed to fetch sticker set '{set_name}': {e}")
+            return False
+
+        self._failed.pop(set_name, None)
+        self._sets[set_name] = {"fetched_at": time.time(), "stickers": categorize_stickers_by_emotion(stickers)}
+        self._reindex()
+        try:
+            await self._save()
+        except Exception as e:
+            logger.error(f"Failed to save the sticker catalog: {e}")
+        logger.info(f"Sticker set '{set_name}' cached.")
+        return True
+
+    async def ensure(self, set_name):
+        """Fetches a set unless it's already known; concurrent callers share one request."""
+        if not set_name or self.knows(set_name):
+            return True
+        return await self.refresh(set_name)
+
+    def _spawn(self, set_name):
+        task = self._inflight.get(set_name)
+        if task is None:
+            task = self._inflight[set_name] = asyncio.create_task(self._fetch(set_name))
+            task.add_done_callback(lambda _: self._inflight.pop(set_name, None))
+        return task
+
+    async def refresh(self, set_name):
+        return await asyncio.shield(self._spawn(set_name))
+
+    def request(self, set_name):
+        """Schedules a fetch for an unknown set in the background, without waiting for it."""
+        if not set_name or self.knows(set_name):
+            return
+        # Sets that failed to load (deleted, private) aren't retried on every sticker
+        if time.time() - self._failed.get(set_name, 0) < self.refresh_interval:
+            return
+        self._spawn(set_name)
+
+    async def _refresh_stale(self):
+        now = time.time()
+        for set_name, sticker_set in list(self._sets.items()):
+            if sticker_set.get("refreshable", True) and now - sticker_set.get("fetched_at", 0) >= self.ttl:
+                await self.refresh(set_name)
+
+    async def _run(self):
+        # The first pass also refreshes sets loaded from an older file
+        while True:
+            try:
+                await self._refresh_stale()
+            except Exception as e:
+                logger.error(f"Sticker catalog refresh failed: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    async def start(self):
+        # The default set must be available before the first reply
+        if STICKER_SET_NAME:
+            await self.ensure(STICKER_SET_NAME)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight.values(), return_exceptions=True)
+
+    def metrics(self):
+        return {"sets": len(self._sets), "inflight": len(self._inflight), **self._stats}
+
+
+sticker_catalog = StickerCatalog()
+register_metrics("sticker_catalog", sticker_catalog.metrics)
@@ -0,0 +1,112 @@
+import os
+import random
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+from src.assistant.metrics import register_metrics
+
+load_dotenv()
+
+# Chats whose rotation state is kept; the least recently active ones are forgotten first
+STICKER_ROTATION_CHATS = int(os.getenv("STICKER_ROTATION_CHATS", 1000))
+
+# Emotion categorization logic
+essential_emotions = {
+    "joy": ["😊", "😂", "😁", "😄", "😎", "🥳"],
+    "happiness": ["😊", "😂", "😁", "😄", "😎", "🥳"],
+    "sadness": ["😢", "😭", "😞", "😔", "😩", "🥺"],
+    "anger": ["😡", "😠", "🤬", "👿", "🔥", "🔪"],
+    "mad": ["😡", "😠", "🤬", "👿", "🔥", "🔪"],
+    "fear": ["😱", "😨", "😰", "😬", "👻"],
+    "love": ["❤️", "💖", "💕", "😍", "😘", "💏", "🤗"],
+    "surprise": ["😮", "😯", "😲", "🤯", "😳"],
+    "disgust": ["🤢", "🤮", "😖", "😷"],
+    "neutral": ["😐", "😑", "😶"],
+}
+
+# Reverse map: emoji -> every emotion it belongs to, in declaration order
+emoji_emotions = {}
+for _emotion, _emoji_list in essential_emotions.items():
+    for _emoji in _emoji_list:
+        emoji_emotions.setdefault(_emoji, []).append(_emotion)
+
+
+def emotion_for_emoji(emoji, default="neutral"):
+    """Returns the primary emotion for an emoji in O(1)."""
+    emotions = emoji_emotions.get(emoji)
+    return emotions[0] if emotions else default
+
+
+class _Rotation:
+    """A shuffled pass over one emotion's stickers for one chat."""
+
+    __slots__ = ("version", "order", "cursor")
+
+    def __init__(self, version, size, last=None):
+        self.version = version
+        self.order = list(range(size))
+        random.shuffle(self.order)
+        # Don't start a new pass with the sticker that ended the previous one
+        if size > 1 and self.order[0] == last:
+            self.order[0], self.order[-1] = self.order[-1], self.order[0]
+        self.cursor = 0
+
+
+class StickerIndex:
+    """
+    Per-emotion sticker arrays with a per-chat shuffled cursor.
+
+    Each chat walks a random permutation of the stickers for an emotion, so nothing repeats until every
+    sticker has been sent once. Rotation state is kept for the most recently active chats only.
+    """
+
+    def __init__(self, max_chats=STICKER_ROTATION_CHATS):
+        self.max_chats = max_chats
+        self._stickers = {}
+        self._version = 0
+        self._rotations = OrderedDict()
+
+    def rebuild(self, emotion_dict):
+        """Replaces the sticker arrays; existing rotations restart lazily on their next pick."""
+        self._stickers = {
+            emotion: tuple(dict.fromkeys(stickers)) for emotion, stickers in (emotion_dict or {}).items()
+        }
+        self._version += 1
+
+    def stickers_for(self, emotion):
+        return self._stickers.get(emotion, ())
+
+    def pick(self, chat_id, emotion):
+        """Returns the next sticker id for the chat and emotion, or None when there are none."""
+        stickers = self._stickers.get(emotion)
+        if not stickers:
+            return None
+
+        chat_rotations = self._rotations.get(chat_id)
+        if chat_rotations is None:
+            chat_rotations = self._rotations[chat_id] = {}
+            if len(self._rotations) > self.max_chats:
+                self._rotations.popitem(last=False)
+        else:
+            self._rotations.move_to_end(chat_id)
+
+        rotation = chat_rotations.get(emotion)
+        if rotation is None or rotation.version != self._version or len(rotation.order) != len(stickers):
+            rotation = chat_rotations[emotion] = _Rotation(self._version, len(stickers))
+        elif rotation.cursor >= len(rotation.order):
+            rotation = chat_rotations[emotion] = _Rotation(self._version, len(stickers), rotation.order[-1])
+
+        sticker_id = stickers[rotation.order[rotation.cursor]]
+        rotation.cursor += 1
+        return sticker_id
+
+    def metrics(self):
+        return {
+            "emotions": len(self._stickers),
+            "stickers": sum(len(stickers) for stickers in self._stickers.values()),
+            "tracked_chats": len(self._rotations),
+        }
+
+
+sticker_index = StickerIndex()
+register_metrics("sticker_index", sticker_index.metrics)
@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+from telethon import TelegramClient, events, utils
+from telethon.tl.types import Channel, Chat, User
+
+from src.assistant.metrics import register_metrics
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+API_ID = os.getenv("API_ID")
+API_HASH = os.getenv("API_HASH")
+TELETHON_SESSION = os.getenv("TELETHON_SESSION", "telethon_session")
+# Recent dialogs are re-read every TELETHON_SYNC_INTERVAL seconds to catch updates missed while disconnected,
+# the whole dialog list only every TELETHON_FULL_SYNC_INTERVAL seconds
+TELETHON_SYNC_INTERVAL = float(os.getenv("TELETHON_SYNC_INTERVAL", 300))
+TELETHON_DELTA_LIMIT = int(os.getenv("TELETHON_DELTA_LIMIT", 100))
+TELETHON_FULL_SYNC_INTERVAL = float(os.getenv("TELETHON_FULL_SYNC_INTERVAL", 24 * 3600))
+
+ENTITY_TYPES = ("user", "bot", "channel", "group", "chat")
+
+
+def classify_entity(entity):
+    if isinstance(entity, User):
+        return "bot" if entity.bot else "user"
+    if isinstance(entity, Channel):
+        return "group" if entity.megagroup or entity.gigagroup else "channel"
+    if isinstance(entity, Chat):
+        return "chat"
+    return None
+
+
+def format_entity(entity, entity_type):
+    return {
+        "id": entity.id,
+        "username": getattr(entity, "username", None),
+        "first_name": getattr(entity, "first_name", None),
+        "last_name": getattr(entity, "last_name", None),
+        "title": getattr(entity, "title", None),
+        "type": entity_type,
+    }
+
+
+class EntityIndex:
+    """
+    Dialog entities grouped by type, most recently active first.
+
+    Mutations happen on the event loop while tools read from worker threads, so access is locked.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_type = {entity_type: OrderedDict() for entity_type in ENTITY_TYPES}
+        self._all = OrderedDict()
+
+    def upsert(self, entity):
+        """Adds or refreshes an entity and moves it to the front as the most recently active."""
+        entity_type = classify_entity(entity)
+        if entity_type is None:
+            return
+        record = format_entity(entity, entity_type)
+        with self._lock:
+            previous = self._all.get(entity.id)
+            if previous is not None and previous["type"] != entity_type:
+                # A group upgraded to a supergroup, or similar
+                self._by_type[previous["type"]].pop(entity.id, None)
+            for entries in (self._by_type[entity_type], self._all):
+                entries[entity.id] = record
+                entries.move_to_end(entity.id, last=False)
+
+    def remove(self, entity_id):
+        with self._lock:
+            record = self._all.pop(entity_id, None)
+            if record is not None:
+                self._by_type[record["type"]].pop(entity_id, None)
+
+    def replace(self, entities):
+        """Rebuilds the index from a full dialog listing (ordered most recent first)."""
+        by_type = {entity_type: OrderedDict() for entity_type in ENTITY_TYPES}
+        everything = OrderedDict()
+        for entity in entities:
+            entity_type = classify_entity(entity)
+            if entity_type is None:
+                continue
+            record = format_entity(entity, entity_type)
+            by_type[entity_type][entity.id] = record
+            everything[entity.id] = record
+        with self._lock:
+            self._by_type, self._all = by_type, everything
+
+    def query(self, entity_type, count, offset=0):
+        """Returns a page of entities and the total number of that type."""
+        with self._lock:
+            entries = self._all if entity_type == "all" else self._by_type[entity_type]
+            total = len(entries)
+            page = []
+            for index, record in enumerate(entries.values()):
+                if index >= offset + count:
+                    break
+                if index >= offset:
+                    page.append(dict(record))
+        return page, total
+
+    def counts(self):
+        with self._lock:
+            return {entity_type: len(entries) for entity_type, entries in self._by_type.items()}
+
+
+class TelethonSessionManager:
+    """
+    Owns one long-lived Telethon client on the application's event loop and keeps the entity index current.
+
+    The index is built from one full dialog listing, then kept up to date by update events and a periodic
+    pass over the most recent dialogs; a full listing is only repeated every TELETHON_FULL_SYNC_INTERVAL.
+    """
+
+    def __init__(self):
+        self.index = EntityIndex()
+        self.client = None
+        self._me_id = None
+        self._task = None
+        self._ready = False
+        self._last_full_sync = 0.0
+        self._stats = {"full_syncs": 0, "delta_syncs": 0, "events": 0, "sync_errors": 0}
+
+    @property
+    def ready(self):
+        return self._ready
+
+    async def start(self):
+        if not API_ID or not API_HASH:
+            logger.info("API_ID/API_HASH are not set, Telegram entity lookups are disabled")
+            return
+        self.client = TelegramClient(TELETHON_SESSION, int(API_ID), API_HASH)
+        try:
+            await self.client.connect()
+            # The server can't answer an interactive login prompt, the session has to be authorized beforehand
+            if not await self.client.is_user_authorized():
+                raise PermissionError(f"Telethon session '{TELETHON_SESSION}' is not authorized")
+            self._me_id = (await self.client.get_me(input_peer=True)).user_id
+        except Exception as e:
+            logger.error(f"Telegram entity lookups are disabled: {e}")
+            await self.client.disconnect()
+            self.client = None
+            return
+
+        self.client.add_event_handler(self._on_message, events.NewMessage())
+        self.client.add_event_handler(self._on_chat_action, events.ChatAction())
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.client is not None:
+            await self.client.disconnect()
+            self.client = None
+        self._ready = False
+
+    async def _full_sync(self):
+        entities = [dialog.entity async for dialog in self.client.iter_dialogs()]
+        self.index.replace(entities)
+        self._last_full_sync = time.monotonic()
+        self._ready = True
+        self._stats["full_syncs"] += 1
+        logger.info(f"Indexed {len(entities)} Telegram dialogs.")
+
+    async def _delta_sync(self):
+        # Dialogs come most recent first; upsert in reverse so the newest ends up in front
+        dialogs = [dialog async for dialog in self.client.iter_dialogs(limit=TELETHON_DELTA_LIMIT)]
+        for dialog in reversed(dialogs):
+            self.index.upsert(dialog.entity)
+        self._stats["delta_syncs"] += 1
+
+    async def _run(self):
+        while True:
+            try:
+                if not self._ready or time.monotonic() - self._last_full_sync >= TELETHON_FULL_SYNC_INTERVAL:
+                    await self._full_sync()
+                else:
+                    await self._delta_sync()
+            except Exception as e:
+                self._stats["sync_errors"] += 1
+                logger.error(f"Telegram dialog sync failed: {e}")
+            await asyncio.sleep(TELETHON_SYNC_INTERVAL)
+
+    async def _on_message(self, event):
+        self._stats["events"] += 1
+        try:
+            chat = await event.get_chat()
+        except Exception as e:
+            logger.debug(f"Couldn't resolve the chat of an update: {e}")
+            return
+        if chat is not None:
+            self.index.upsert(chat)
+
+    async def _on_chat_action(self, event):
+        self._stats["events"] += 1
+        if (event.user_left or event.user_kicked) and event.user_id == self._me_id:
+            # Index keys are bare entity ids, event ids are marked (-100... for channels)
+            self.index.remove(utils.resolve_id(event.chat_id)[0])
+            return
+        try:
+            chat = await event.get_chat()
+        except Exception:
+            return
+        if chat is not None:
+            self.index.upsert(chat)
+
+    def metrics(self):
+        return {"connected": self.client is not None, "ready": self._ready, **self.index.counts(), **self._stats}
+
+
+telethon_session = TelethonSessionManager()
+register_metrics("telethon_session", telethon_session.metrics)
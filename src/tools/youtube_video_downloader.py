@@ -1,66 +1,377 @@
-import yt_dlp
-import os
 import asyncio
+import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from queue import Empty
 from dotenv import load_dotenv
 from telegram import Update, InputFile
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
 
+from src.assistant.http_client import http_clients
+from src.assistant.metrics import register_metrics
+from src.assistant.outbound import outbound, Priority
+from src.tools.ytdl_worker import probe_video, download_video
+
 load_dotenv()
 
+# Set up the logger
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
 chat_id = os.getenv("CHAT_ID")
-# Configure yt-dlp options
-YDL_OPTIONS = {
-    'format': 'bestvideo[height<=1080]+bestaudio/best',  # Download up to 1080p or best available quality
-    'outtmpl': 'downloads/%(title)s.%(ext)s',  # Save videos in 'downloads' folder
-    'quiet': True  # Suppress verbose output
-}
-
-# Ensure the downloads folder exists
-os.makedirs("downloads", exist_ok=True)
-
-# Asynchronous download function
-async def download_video_async(video_url: str):
+DOWNLOAD_DIR = os.getenv("YTDL_DOWNLOAD_DIR", "downloads")
+# Worker processes running yt-dlp; also the number of downloads that run at the same time
+YTDL_WORKERS = int(os.getenv("YTDL_WORKERS", 2))
+# Distinct videos that may be queued or downloading at once
+YTDL_MAX_PENDING = int(os.getenv("YTDL_MAX_PENDING", 8))
+# Finished videos are kept under DOWNLOAD_DIR up to this size, least recently used are evicted first
+YTDL_CACHE_BYTES = int(os.getenv("YTDL_CACHE_MB", 2048)) * 1024 * 1024
+# Bot API limit for files uploaded by bots
+YTDL_MAX_UPLOAD_BYTES = int(os.getenv("YTDL_MAX_UPLOAD_MB", 50)) * 1024 * 1024
+YTDL_MAX_HEIGHT = int(os.getenv("YTDL_MAX_HEIGHT", 1080))
+YTDL_PROGRESS_INTERVAL = float(os.getenv("YTDL_PROGRESS_INTERVAL", 5))
+# Seconds between reads of a download's progress queue; workers report at most once a second
+YTDL_PROGRESS_POLL = 0.5
+# Size estimates are approximate, leave headroom for the container overhead
+SIZE_HEADROOM = 0.95
+
+# Workers are forked from a server process that only preloads yt-dlp. Forking the application would copy its
+# threads, event loop and open connections into every worker
+YTDL_MP_CONTEXT = multiprocessing.get_context("forkserver")
+YTDL_MP_CONTEXT.set_forkserver_preload(["src.tools.ytdl_worker"])
+
+VIDEO_ID_PATTERN = re.compile(r"(?:v=|youtu\.be/|shorts/|embed/|live/)([\w-]{11})")
+
+
+def parse_video_id(video_url: str):
+    match = VIDEO_ID_PATTERN.search(video_url)
+    return match.group(1) if match else None
+
+
+def estimate_size(fmt, duration):
+    size = fmt.get("filesize") or fmt.get("filesize_approx")
+    if size:
+        return size
+    if fmt.get("tbr") and duration:
+        return fmt["tbr"] * 125 * duration  # kbit/s -> bytes
+    return None
+
+
+def select_format(info, limit=YTDL_MAX_UPLOAD_BYTES, max_height=YTDL_MAX_HEIGHT):
+    """
+    Picks the highest resolution format, or video+audio pair, whose estimated size fits the upload limit.
+    Returns a yt-dlp format spec, or None when nothing fits.
+    """
+    duration = info.get("duration")
+    budget = limit * SIZE_HEADROOM
+
+    def has_video(fmt):
+        return fmt.get("vcodec") not in (None, "none")
+
+    def has_audio(fmt):
+        return fmt.get("acodec") not in (None, "none")
+
+    audio_streams = [
+        (size, fmt) for fmt in info["formats"]
+        if has_audio(fmt) and not has_video(fmt) and (size := estimate_size(fmt, duration))
+    ]
+
+    candidates = []
+    for fmt in info["formats"]:
+        height = fmt.get("height") or 0
+        size = estimate_size(fmt, duration)
+        if not has_video(fmt) or height > max_height or not size:
+            continue
+        if has_audio(fmt):
+            candidates.append((height, size, fmt["format_id"]))
+            continue
+        # Pair the video stream with the best audio stream that still fits next to it
+        fitting_audio = [(audio_size, audio) for audio_size, audio in audio_streams if size + audio_size <= budget]
+        if fitting_audio:
+            audio_size, audio = max(fitting_audio, key=lambda entry: entry[0])
+            candidates.append((height, size + audio_size, f"{fmt['format_id']}+{audio['format_id']}"))
+
+    fitting = [candidate for candidate in candidates if candidate[1] <= budget]
+    return max(fitting)[2] if fitting else None
+
+
+class _DownloadJob:
+    def __init__(self, video_url, video_id=None):
+        self.video_url = video_url
+        # Taken from the URL, or from the probe for links that don't carry it; names the job's files
+        self.video_id = video_id
+        self.title = None
+        self.progress = None
+        self.task = None
+
+    def describe(self):
+        title = self.title or self.video_url
+        if not self.progress:
+            return f"Preparing {title}..."
+        downloaded, total = self.progress
+        if total:
+            return f"Downloading {title}: {downloaded * 100 // total}% of {total / 1024 / 1024:.1f} MB"
+        return f"Downloading {title}: {downloaded / 1024 / 1024:.1f} MB"
+
+
+class VideoDownloader:
+    """
+    Runs yt-dlp in a bounded process pool so downloads never block the event loop.
+
+    Requests for the same video share one in-flight job, finished files are served from a size-bounded cache
+    under DOWNLOAD_DIR, and the format is chosen up front so the result fits the Bot API upload limit.
+    """
+
+    def __init__(self, directory=DOWNLOAD_DIR, workers=YTDL_WORKERS, max_pending=YTDL_MAX_PENDING,
+                 cache_bytes=YTDL_CACHE_BYTES, max_upload_bytes=YTDL_MAX_UPLOAD_BYTES):
+        self.directory = directory
+        self.workers = workers
+        self.max_pending = max_pending
+        self.cache_bytes = cache_bytes
+        self.max_upload_bytes = max_upload_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._pool = None
+        self._manager = None
+        self._inflight = {}
+        # Videos being uploaded are never evicted
+        self._pinned = {}
+        self._titles = {}
+        self._background = set()
+        self._stats = {"requests": 0, "cache_hits": 0, "shared": 0, "downloads": 0, "failures": 0, "evicted": 0}
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=YTDL_MP_CONTEXT)
+        return self._pool
+
+    def _progress_queue(self):
+        # Proxy queues can be handed to pool workers, plain multiprocessing queues can't
+        if self._manager is None:
+            self._manager = YTDL_MP_CONTEXT.Manager()
+        return self._manager.Queue()
+
+    def _cached_path(self, video_id):
+        prefix = f"{video_id}."
+        for name in os.listdir(self.directory):
+            # Final files are "<id>.<ext>"; "<id>.f137.mp4" and "<id>.mp4.part" are intermediate
+            if name.startswith(prefix) and "." not in name[len(prefix):] and not name.endswith((".part", ".ytdl")):
+                return os.path.join(self.directory, name)
+        return None
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                entries.append((entry.stat().st_mtime, entry.stat().st_size, entry.path, entry.name.split(".")[0]))
+        total = sum(size for _, size, _, _ in entries)
+        # In-flight jobs may be keyed by URL, their partial files are named after the video id
+        protected = set(self._pinned) | {job.video_id for job in self._inflight.values() if job.video_id}
+        for _, size, path, video_id in sorted(entries):
+            if total <= self.cache_bytes:
+                break
+            if video_id in protected:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                self._stats["evicted"] += 1
+            except OSError as e:
+                logger.warning(f"Couldn't evict {path}: {e}")
+
+    async def _poll_progress(self, job, queue):
+        # Polled from the loop, a blocking get would hold a default-executor thread for the whole download
+        while True:
+            try:
+                while (item := queue.get_nowait()) is not None:
+                    job.progress = item
+                return
+            except Empty:
+                await asyncio.sleep(YTDL_PROGRESS_POLL)
+
+    async def _download(self, job, video_id):
+        loop = asyncio.get_running_loop()
+        info = await loop.run_in_executor(self._executor(), probe_video, job.video_url)
+        job.title = info["title"]
+        job.video_id = info["id"]
+
+        # Links that don't carry the id in the URL are only recognized after the probe
+        cached = self._cached_path(info["id"]) if video_id is None else None
+        if cached:
+            self._stats["cache_hits"] += 1
+            return cached, job.title
+
+        format_spec = select_format(info, self.max_upload_bytes)
+        if format_spec is None:
+            raise ValueError(f"No format of '{job.title}' fits the {self.max_upload_bytes // 1024 // 1024} MB upload limit.")
+
+        queue = self._progress_queue()
+        poller = asyncio.create_task(self._poll_progress(job, queue))
+        try:
+            path = await loop.run_in_executor(
+                self._executor(), download_video, job.video_url, format_spec, self.directory, queue
+            )
+        finally:
+            # The worker sends the sentinel itself, this covers a worker that died
+            queue.put(None)
+            await poller
+
+        if os.path.getsize(path) > self.max_upload_bytes:
+            os.remove(path)
+            raise ValueError(f"'{job.title}' came out larger than the upload limit.")
+        self._stats["downloads"] += 1
+        self._titles[info["id"]] = job.title
+        return path, job.title
+
+    def _start(self, video_url):
+        video_id = parse_video_id(video_url)
+        job = self._inflight.get(video_id) if video_id else None
+        if job is not None:
+            self._stats["shared"] += 1
+            return job, video_id
+
+        if len(self._inflight) >= self.max_pending:
+            raise RuntimeError("Too many videos are being downloaded right now, try again in a bit.")
+
+        job = _DownloadJob(video_url, video_id)
+        key = video_id or video_url
+        job.task = asyncio.create_task(self._download(job, video_id))
+        self._inflight[key] = job
+
+        def finished(task):
+            self._inflight.pop(key, None)
+            if task.cancelled() or task.exception() is not None:
+                self._stats["failures"] += 1
+
+        job.task.add_done_callback(finished)
+        return job, video_id
+
+    @asynccontextmanager
+    async def video(self, video_url, on_progress=None):
+        """
+        Yields (path, title) of the downloaded video, keeping the file out of eviction while in use.
+        `on_progress(text)` is awaited every YTDL_PROGRESS_INTERVAL seconds while the download runs.
+        """
+        self._stats["requests"] += 1
+        video_id = parse_video_id(video_url)
+        cached = self._cached_path(video_id) if video_id else None
+        if cached:
+            self._stats["cache_hits"] += 1
+            title = self._titles.get(video_id, video_id)
+        else:
+            job, video_id = self._start(video_url)
+            last_report = None
+            while not job.task.done():
+                await asyncio.wait([job.task], timeout=YTDL_PROGRESS_INTERVAL)
+                report = job.describe()
+                if on_progress is not None and not job.task.done() and report != last_report:
+                    last_report = report
+                    await on_progress(report)
+            cached, title = job.task.result()
+
+        pin = os.path.basename(cached).split(".")[0]
+        self._pinned[pin] = self._pinned.get(pin, 0) + 1
+        try:
+            # Mark as recently used, then make room for it
+            os.utime(cached)
+            self._evict()
+            yield cached, title
+        finally:
+            self._pinned[pin] -= 1
+            if not self._pinned[pin]:
+                del self._pinned[pin]
+
+    def spawn(self, coroutine):
+        """Runs a delivery in the background, keeping a reference so it isn't garbage collected."""
+        task = asyncio.create_task(coroutine)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def stop(self):
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    def metrics(self):
+        return {"inflight": len(self._inflight), "uploading": len(self._pinned), **self._stats}
+
+
+video_downloader = VideoDownloader()
+register_metrics("video_downloads", video_downloader.metrics)
+
+
+async def _upload_video(target_chat_id, path, title):
+    # Stream the file from disk instead of reading it into memory; reopened on every retry
+    with open(path, "rb") as video_file:
+        return await http_clients.bot.send_video(
+            chat_id=target_chat_id,
+            video=InputFile(video_file, read_file_handle=False),
+            caption=f"Here's your video: {title}",
+            supports_streaming=True,
+        )
+
+
+async def deliver_video(target_chat_id, video_url: str):
+    """Downloads a video and sends it to the chat, reporting progress in a status message."""
+    bot = http_clients.bot
+    status = await outbound.send(
+        target_chat_id,
+        lambda: bot.send_message(chat_id=target_chat_id, text=f"Downloading video from: {video_url}..."),
+        Priority.NOTICE,
+    )
+
+    async def report(text):
+        if status is not None:
+            # Progress edits are cosmetic, skip them when the chat is busy
+            await outbound.send(target_chat_id, lambda: status.edit_text(text), Priority.COSMETIC,
+                                max_wait=YTDL_PROGRESS_INTERVAL)
+
     try:
-        with yt_dlp.YoutubeDL(YDL_OPTIONS) as ydl:
-            info = ydl.extract_info(video_url, download=True)
-        video_path = f"downloads/{info['title']}.{info['ext']}"
-        return video_path, info["title"]
+        async with video_downloader.video(video_url, report) as (path, title):
+            await outbound.send(target_chat_id, lambda: _upload_video(target_chat_id, path, title), Priority.MEDIA)
+        if status is not None:
+            await outbound.send(target_chat_id, lambda: status.delete(), Priority.COSMETIC)
     except Exception as e:
-        raise RuntimeError(f"Failed to download video: {e}")
+        logger.error(f"Failed to deliver video {video_url}: {e}")
+        await outbound.send(
+            target_chat_id, lambda: bot.send_message(chat_id=target_chat_id, text=f"Failed to download video: {e}")
+        )
 
 # Telegram integration
 async def send_downloaded_video(update: Update, video_url: str):
     """
     Download a YouTube video and send it to the user.
     """
-    try:
-        await update.message.reply_text(f"Downloading video from: {video_url}...")
-        video_path, video_title = await download_video_async(video_url)
-        with open(video_path, 'rb') as video_file:
-            await update.message.reply_video(InputFile(video_file), caption=f"Here's your video: {video_title}")
-    except Exception as e:
-        await update.message.reply_text(f"Failed to download video: {e}")
+    await deliver_video(update.effective_chat.id, video_url)
 
-async def youtube_download_tool(video_url: str):
+async def youtube_download_tool(video_url: str, target_chat_id=None):
     """
     A YouTube downloader tool to download and send a video to a Telegram user.
 
     Parameters:
     - video_url: URL of the YouTube video to download.
     """
-    from telegram import Bot
-
-    bot = Bot(token=os.getenv("TELEGRAM_BOT_TOKEN"))
-    try:
-        video_path, video_title = await download_video_async(video_url)
-        with open(video_path, 'rb') as video_file:
-            await bot.send_video(chat_id=chat_id, video=InputFile(video_file), caption=f"Here's your video: {video_title}")
-    except Exception as e:
-        await bot.send_message(chat_id=chat_id, text=f"Failed to download video: {e}")
+    video_downloader.spawn(deliver_video(target_chat_id or chat_id, video_url))
 
 @tool
-def sync_youtube_download_tool(video_url: str):
+async def youtube_download(video_url: str, config: RunnableConfig):
     """
-    A wrapper for the asynchronous youtube_download_tool.
+    Download a YouTube video and send it to the chat.
+
+    Parameters:
+        video_url (str): URL of the YouTube video to download.
     """
-    return asyncio.run(youtube_download_tool(video_url))
\ No newline at end of file
+    # Downloads take minutes, the video is sent on its own once ready
+    await youtube_download_tool(video_url, config.get("configurable", {}).get("thread_id"))
+    return "(*the video is being downloaded and will be sent to the chat when it's ready*)"
@@ -0,0 +1,56 @@
+# yt-dlp jobs executed in the download process pool. Kept free of application imports so worker
+# processes start light and never touch the bot or the event loop.
+import os
+import time
+
+import yt_dlp
+
+# Minimum seconds between two progress reports sent back to the application
+PROGRESS_EVERY = 1.0
+
+FORMAT_FIELDS = ("format_id", "ext", "vcodec", "acodec", "height", "tbr", "abr", "filesize", "filesize_approx")
+
+
+def probe_video(video_url: str):
+    """Reads the metadata and the available formats without downloading anything."""
+    with yt_dlp.YoutubeDL({"quiet": True, "noplaylist": True}) as ydl:
+        info = ydl.extract_info(video_url, download=False)
+    return {
+        "id": info["id"],
+        "title": info.get("title") or info["id"],
+        "duration": info.get("duration"),
+        "formats": [{field: fmt.get(field) for field in FORMAT_FIELDS} for fmt in info.get("formats") or []],
+    }
+
+
+def download_video(video_url: str, format_spec: str, directory: str, progress_queue=None):
+    """Downloads one format selection into `directory` and returns the final file path."""
+    last_report = 0.0
+
+    def report(status):
+        nonlocal last_report
+        if progress_queue is None or status.get("status") != "downloading":
+            return
+        now = time.monotonic()
+        if now - last_report < PROGRESS_EVERY:
+            return
+        last_report = now
+        total = status.get("total_bytes") or status.get("total_bytes_estimate")
+        progress_queue.put((status.get("downloaded_bytes") or 0, total))
+
+    options = {
+        "format": format_spec,
+        "outtmpl": os.path.join(directory, "%(id)s.%(ext)s"),
+        "merge_output_format": "mp4",
+        "noplaylist": True,
+        "quiet": True,
+        "progress_hooks": [report],
+    }
+    try:
+        with yt_dlp.YoutubeDL(options) as ydl:
+            info = ydl.extract_info(video_url, download=True)
+            downloads = info.get("requested_downloads") or [{}]
+            return downloads[0].get("filepath") or ydl.prepare_filename(info)
+    finally:
+        if progress_queue is not None:
+            progress_queue.put(None)
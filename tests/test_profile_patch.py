@@ -0,0 +1,66 @@
+import sys
+import types
+
+import pytest
+
+# src.agents.utils opens the Chroma store and the LLM clients on import; the patch helpers need neither
+sys.modules.setdefault("src.agents.utils", types.SimpleNamespace(llm=None, llm_for_check=None))
+
+from src.memory.profile_memory import apply_profile_patch  # noqa: E402
+
+
+@pytest.fixture
+def profile():
+    return {"name": "Ann", "interests": ["chess"], "location": {"city": "Oslo", "country": "Norway"}}
+
+
+def test_replace_add_and_remove(profile):
+    patched = apply_profile_patch(profile, [
+        {"op": "replace", "path": "/name", "value": "Anna"},
+        {"op": "add", "path": "/interests/-", "value": "go"},
+        {"op": "remove", "path": "/location/city"},
+    ])
+    assert patched == {"name": "Anna", "interests": ["chess", "go"], "location": {"country": "Norway"}}
+
+
+def test_original_profile_is_not_modified(profile):
+    apply_profile_patch(profile, [{"op": "replace", "path": "/location/city", "value": "Bergen"}])
+    assert profile["location"]["city"] == "Oslo"
+
+
+def test_add_single_item_to_list_field(profile):
+    patched = apply_profile_patch(profile, [
+        {"op": "add", "path": "/interests", "value": "go"},
+        {"op": "add", "path": "/interests", "value": "chess"},
+    ])
+    assert patched["interests"] == ["chess", "go"]
+
+
+def test_missing_parents_are_created(profile):
+    patched = apply_profile_patch(profile, [{"op": "add", "path": "/work/company", "value": "Acme"}])
+    assert patched["work"] == {"company": "Acme"}
+
+
+def test_escaped_tokens(profile):
+    patched = apply_profile_patch(profile, [{"op": "add", "path": "/a~1b~0c", "value": 1}])
+    assert patched["a/b~c"] == 1
+
+
+@pytest.mark.parametrize("operation", [
+    "not an operation",
+    None,
+    ["op", "add"],
+    {"op": "add", "path": 5, "value": "x"},
+    {"op": "add", "path": None, "value": "x"},
+    {"op": "add", "path": "name", "value": "x"},
+    {"op": "add", "path": "/", "value": "x"},
+    {"op": "move", "path": "/name", "value": "x"},
+    {"op": "add", "path": "/interests/7", "value": "x"},
+    {"op": "replace", "path": "/interests/first", "value": "x"},
+    {"op": "add", "path": "/name/first", "value": "x"},
+    {"op": "add", "path": "/name/first/initial", "value": "x"},
+    {"op": "replace", "path": "/name"},
+])
+def test_invalid_operations_are_skipped(profile, operation):
+    patched = apply_profile_patch(profile, [operation, {"op": "replace", "path": "/name", "value": "Anna"}])
+    assert patched == {**profile, "name": "Anna"}
@@ -0,0 +1,40 @@
+import pytest
+
+from src.assistant.transcription import plan_chunks
+
+
+def test_short_note_is_one_chunk():
+    assert plan_chunks(45.0, [(10.0, 11.0)], target=60) == [(0.0, 45.0)]
+
+
+def test_exactly_target_is_one_chunk():
+    assert plan_chunks(60.0, [], target=60) == [(0.0, 60.0)]
+
+
+def test_cuts_in_the_middle_of_the_last_pause_before_the_limit():
+    silences = [(20.0, 21.0), (40.0, 41.0), (55.0, 57.0), (90.0, 92.0)]
+    assert plan_chunks(100.0, silences, target=60) == [(0.0, 56.0), (56.0, 100.0)]
+
+
+def test_hard_cut_without_pauses():
+    assert plan_chunks(130.0, [], target=60) == [(0.0, 60.0), (60.0, 120.0), (120.0, 130.0)]
+
+
+def test_pauses_in_the_first_half_of_a_part_are_ignored():
+    # Cutting at 10 s would leave a long remainder split into many short parts
+    assert plan_chunks(100.0, [(9.0, 11.0)], target=60) == [(0.0, 60.0), (60.0, 100.0)]
+
+
+def test_chunks_cover_the_note_without_gaps_and_stay_within_target():
+    silences = [(start, start + 0.6) for start in range(7, 300, 13)]
+    chunks = plan_chunks(300.0, silences, target=60)
+    assert chunks[0][0] == 0.0 and chunks[-1][1] == 300.0
+    assert all(previous[1] == current[0] for previous, current in zip(chunks, chunks[1:]))
+    assert all(0 < end - start <= 60 for start, end in chunks)
+
+
+@pytest.mark.parametrize("duration", [61.0, 119.9, 600.0])
+def test_every_part_fits_the_target(duration):
+    chunks = plan_chunks(duration, [], target=60)
+    assert all(end - start <= 60 for start, end in chunks)
+    assert chunks[-1][1] == duration
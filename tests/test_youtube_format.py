@@ -0,0 +1,89 @@
+import os
+import tempfile
+
+import pytest
+
+# The module creates its download directory on import
+os.environ.setdefault("YTDL_DOWNLOAD_DIR", os.path.join(tempfile.gettempdir(), "yui-test-downloads"))
+
+from src.tools.youtube_video_downloader import parse_video_id, select_format  # noqa: E402
+
+MB = 1024 * 1024
+
+
+@pytest.mark.parametrize("url, video_id", [
+    ("https://www.youtube.com/watch?v=dQw4w9WgXcQ", "dQw4w9WgXcQ"),
+    ("https://www.youtube.com/watch?list=PL123&v=dQw4w9WgXcQ&t=42s", "dQw4w9WgXcQ"),
+    ("https://youtu.be/dQw4w9WgXcQ?si=abc", "dQw4w9WgXcQ"),
+    ("https://youtube.com/shorts/a-b_c1234XY", "a-b_c1234XY"),
+    ("https://www.youtube.com/embed/dQw4w9WgXcQ", "dQw4w9WgXcQ"),
+    ("https://www.youtube.com/live/dQw4w9WgXcQ?feature=share", "dQw4w9WgXcQ"),
+    ("https://www.youtube.com/@channel", None),
+    ("https://example.com/video.mp4", None),
+])
+def test_parse_video_id(url, video_id):
+    assert parse_video_id(url) == video_id
+
+
+def video(format_id, height, size, audio=False):
+    return {"format_id": format_id, "vcodec": "avc1", "acodec": "mp4a" if audio else "none",
+            "height": height, "filesize": size}
+
+
+def audio(format_id, size):
+    return {"format_id": format_id, "vcodec": "none", "acodec": "opus", "height": None, "filesize": size}
+
+
+def test_picks_highest_resolution_that_fits():
+    info = {"duration": 60, "formats": [
+        video("18", 360, 10 * MB, audio=True),
+        video("22", 720, 30 * MB, audio=True),
+        video("137", 1080, 80 * MB),
+        audio("251", 3 * MB),
+    ]}
+    assert select_format(info, limit=50 * MB) == "22"
+
+
+def test_pairs_video_with_best_fitting_audio():
+    info = {"duration": 60, "formats": [
+        video("18", 360, 10 * MB, audio=True),
+        video("136", 720, 40 * MB),
+        audio("140", 2 * MB),
+        audio("251", 4 * MB),
+        audio("258", 15 * MB),
+    ]}
+    assert select_format(info, limit=50 * MB) == "136+251"
+
+
+def test_respects_max_height():
+    info = {"duration": 60, "formats": [
+        video("22", 720, 20 * MB, audio=True),
+        video("137", 1080, 30 * MB, audio=True),
+    ]}
+    assert select_format(info, limit=50 * MB, max_height=720) == "22"
+
+
+def test_estimates_size_from_bitrate():
+    info = {"duration": 100, "formats": [
+        # 4000 kbit/s for 100 s is 50 MB, more than fits
+        {"format_id": "hi", "vcodec": "avc1", "acodec": "mp4a", "height": 1080, "tbr": 4000},
+        {"format_id": "lo", "vcodec": "avc1", "acodec": "mp4a", "height": 480, "tbr": 1000},
+    ]}
+    assert select_format(info, limit=50 * MB) == "lo"
+
+
+def test_formats_without_size_are_ignored():
+    info = {"duration": None, "formats": [
+        {"format_id": "unknown", "vcodec": "avc1", "acodec": "mp4a", "height": 1080},
+        video("18", 360, 10 * MB, audio=True),
+    ]}
+    assert select_format(info, limit=50 * MB) == "18"
+
+
+def test_returns_none_when_nothing_fits():
+    info = {"duration": 600, "formats": [
+        video("18", 360, 60 * MB, audio=True),
+        video("134", 360, 45 * MB),
+        audio("251", 8 * MB),
+    ]}
+    assert select_format(info, limit=50 * MB) is None